@@ -0,0 +1,105 @@
+"""
+The offset matrix decomposition kernel used by krTxToOffset, for the matrices of a whole batch at once.
+Pure Python and NumPy - no Maya calls, so it can be run, timed and tested outside of Maya.
+
+Matrices are (N, 4, 4) arrays laid out the same as an MMatrix (row vectors, translation in the last row),
+and are composed the Maya way:  scale * shear * rotation * translation
+
+Rotate orders are the rotateOrder enum values:  xyz, yzx, zxy, xzy, yxz, zyx
+"""
+
+import numpy as np
+
+
+IDENTITY_TOLERANCE = 1.0e-9
+
+# the axes of each rotate order, in the order they are applied
+ROTATE_ORDER_AXES = ((0, 1, 2), (1, 2, 0), (2, 0, 1), (0, 2, 1), (1, 0, 2), (2, 1, 0))
+
+
+def identity_mask(matrices, tolerance=IDENTITY_TOLERANCE):
+    '''
+    Returns an (N,) bool array - True where every element of the matrix is within the tolerance of the identity
+    '''
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+
+    return np.all(np.abs(matrices - np.identity(4)) <= tolerance, axis=(1, 2))
+
+
+def decompose_matrices(matrices, rotate_orders=None):
+    '''
+    Returns (N, 3) arrays of the translate, rotate (degrees, in the given rotate orders), scale and shear
+    '''
+    matrices = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+    count = matrices.shape[0]
+
+    if rotate_orders is None:
+        rotate_orders = np.zeros(count, dtype=np.int64)
+    else:
+        rotate_orders = np.asarray(rotate_orders, dtype=np.int64).reshape(count)
+
+    # the translation is the last row
+    translate = matrices[:, 3, :3].copy()
+
+    # the rows of the upper 3x3 are the rotation axes, scaled and sheared - separate them with gram-schmidt
+    row_x = matrices[:, 0, :3]
+    row_y = matrices[:, 1, :3]
+    row_z = matrices[:, 2, :3]
+
+    tiny = np.finfo(np.float64).tiny
+
+    scale_x = np.linalg.norm(row_x, axis=1)
+    axis_x = row_x / np.maximum(scale_x, tiny)[:, None]
+
+    shear_xy = np.einsum('ij,ij->i', row_y, axis_x)
+    row_y = row_y - shear_xy[:, None] * axis_x
+    scale_y = np.linalg.norm(row_y, axis=1)
+    axis_y = row_y / np.maximum(scale_y, tiny)[:, None]
+
+    shear_xz = np.einsum('ij,ij->i', row_z, axis_x)
+    shear_yz = np.einsum('ij,ij->i', row_z, axis_y)
+    row_z = row_z - shear_xz[:, None] * axis_x - shear_yz[:, None] * axis_y
+    scale_z = np.linalg.norm(row_z, axis=1)
+    axis_z = row_z / np.maximum(scale_z, tiny)[:, None]
+
+    # a mirrored matrix keeps a right handed rotation, and the negative scale goes on z
+    flip = np.einsum('ij,ij->i', np.cross(axis_x, axis_y), axis_z) < 0.0
+    scale_z = np.where(flip, -scale_z, scale_z)
+    axis_z = np.where(flip[:, None], -axis_z, axis_z)
+
+    safe_y = np.where(scale_y == 0.0, 1.0, scale_y)
+    safe_z = np.where(scale_z == 0.0, 1.0, scale_z)
+
+    scale = np.stack((scale_x, scale_y, scale_z), axis=1)
+    shear = np.stack((shear_xy / safe_y, shear_xz / safe_z, shear_yz / safe_z), axis=1)
+
+    # the rotation matrix in column form (the transpose of the rows), so the angles read the textbook way
+    rotation = np.stack((axis_x, axis_y, axis_z), axis=2)
+
+    # the euler angles for each rotate order - the first three orders are even permutations, the rest odd
+    rotate = np.zeros((count, 3))
+
+    for order, (i, j, k) in enumerate(ROTATE_ORDER_AXES):
+        mask = rotate_orders == order
+        if not mask.any():
+            continue
+
+        order_rotation = rotation[mask]
+        sign = 1.0 if order < 3 else -1.0
+
+        angle_b = np.arcsin(np.clip(-sign * order_rotation[:, k, i], -1.0, 1.0))
+
+        # in gimbal lock, the last rotation is folded into the first
+        cos_b = np.sqrt(order_rotation[:, i, i] ** 2 + order_rotation[:, j, i] ** 2)
+        gimbal = cos_b < 1.0e-6
+
+        angle_a = np.where(gimbal,
+                           np.arctan2(-sign * order_rotation[:, j, k], order_rotation[:, j, j]),
+                           np.arctan2(sign * order_rotation[:, k, j], order_rotation[:, k, k]))
+        angle_c = np.where(gimbal, 0.0, np.arctan2(sign * order_rotation[:, j, i], order_rotation[:, i, i]))
+
+        rotate[mask, i] = angle_a
+        rotate[mask, j] = angle_b
+        rotate[mask, k] = angle_c
+
+    return translate, np.degrees(rotate), scale, shear
@@ -2,8 +2,32 @@ import maya.api.OpenMaya as om
 import maya.api.OpenMayaUI as omui
 import maya.api.OpenMayaRender as omr
 import maya.cmds as cmds
+import maya.utils
 import os
-import maya.mel as mel
+import csv
+import json
+import math
+import operator
+import re
+import time
+import functools
+import string
+import textwrap
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# the krTxToOffset kernel - kept in its own module, without Maya, so it can be tested on its own.  It needs numpy, and is
+# only found if it is on the Python path (Maya does not add the plug-in folder) - without it, krTxToOffset uses MMatrix instead
+try:
+    import krMatrixKernel
+except ImportError:
+    krMatrixKernel = None
 
 
 def maya_useNewAPI():
@@ -20,9 +44,13 @@ Plugs Input:        None
 Plugs Output:       None
 
 Node Attributes:    text_display    String      The text to be displayed
+                    text_template   String      Displayed instead of the text, with live values - "IK/FK: {ctrl.ikFk}  Frame: {time}"
                     text_coord_x    int         x position of the text
                     text_coord_r    int         y position of the text
+                    text_max_width  int         width to word wrap the text at, as a percentage of the viewport - 0 to not wrap
                     colour          enum        black, white, red, green, blue, yellow, papaya, pink
+                    entries         compound[]  extra lines of text, all drawn together - each with entry_text, entry_size,
+                                                entry_x_percentage, entry_y_percentage, entry_max_width, entry_align and entry_colour
 '''
 
 class HelpTextNode(omui.MPxLocatorNode):
@@ -32,9 +60,93 @@ class HelpTextNode(omui.MPxLocatorNode):
     DRAW_CLASSIFICATION = 'drawdb/geometry/krHelpText'
     DRAW_REGISTRANT_ID = 'HelpTextNode'
 
+    # the colour enum values, and the alignment enum values as draw manager alignments
+    PALETTE = (om.MColor((0.0, 0.0, 0.0, 1.0)),     # black
+               om.MColor((1.0, 1.0, 1.0, 1.0)),     # white
+               om.MColor((0.8, 0.0, 0.0, 1.0)),     # red
+               om.MColor((0.0, 0.8, 0.0, 1.0)),     # green
+               om.MColor((0.0, 0.0, 0.8, 1.0)),     # blue
+               om.MColor((1.0, 1.0, 0.0, 1.0)),     # yellow
+               om.MColor((1.0, 0.5, 0.0, 1.0)),     # papaya
+               om.MColor((0.5, 0.0, 1.0, 1.0)))     # pink
+
+    ALIGNMENTS = (omr.MUIDrawManager.kLeft, omr.MUIDrawManager.kCenter, omr.MUIDrawManager.kRight)
+
     def __init__(self):
         super(HelpTextNode, self).__init__()
 
+        # incremented whenever an attribute changes, so the draw override knows when its data is out of date
+        self.draw_version = 0
+        self.callback_ids = []
+
+        # the callbacks on the nodes referenced by the text template, and on the time
+        self.template_callback_ids = []
+
+    def postConstructor(self):
+        # set attributes are caught by the attribute changed callback, and driven (animated or connected) ones by the dirty plug callback
+        node = self.thisMObject()
+        self.callback_ids.append(om.MNodeMessage.addAttributeChangedCallback(node, HelpTextNode.attribute_changed))
+        self.callback_ids.append(om.MNodeMessage.addNodeDirtyPlugCallback(node, HelpTextNode.plug_dirty))
+
+    def __del__(self):
+        for callback_id in self.callback_ids + self.template_callback_ids:
+            try:
+                om.MMessage.removeCallback(callback_id)
+            except:
+                pass
+
+    def watch_template(self, template_plugs, watch_time):
+        # redraw when a plug used by the text template is set, or when the time changes (for animated plugs and the time itself)
+        for callback_id in self.template_callback_ids:
+            om.MMessage.removeCallback(callback_id)
+        self.template_callback_ids = []
+
+        node = self.thisMObject()
+
+        if watch_time:
+            self.template_callback_ids.append(om.MDGMessage.addTimeChangeCallback(HelpTextNode.template_time_changed, node))
+
+        watched = set()
+        for plug in template_plugs:
+            if plug is None:
+                continue
+
+            plug_node = plug.node()
+            node_hash = om.MObjectHandle(plug_node).hashCode()
+            if node_hash in watched:
+                continue
+            watched.add(node_hash)
+
+            self.template_callback_ids.append(om.MNodeMessage.addAttributeChangedCallback(plug_node, HelpTextNode.template_input_changed, node))
+
+    @staticmethod
+    def template_time_changed(time, node):
+        omr.MRenderer.setGeometryDrawDirty(node)
+
+    @staticmethod
+    def template_input_changed(msg, plug, other_plug, node):
+        # only the template values are read again - the draw version is left alone, so the other attributes are not
+        if msg & om.MNodeMessage.kAttributeSet:
+            omr.MRenderer.setGeometryDrawDirty(node)
+
+    @staticmethod
+    def attribute_changed(msg, plug, other_plug, client_data):
+        if msg & (om.MNodeMessage.kAttributeSet | om.MNodeMessage.kConnectionMade | om.MNodeMessage.kConnectionBroken):
+            HelpTextNode.mark_draw_dirty(plug.node())
+
+    @staticmethod
+    def plug_dirty(node, plug, client_data):
+        HelpTextNode.mark_draw_dirty(node)
+
+    @staticmethod
+    def mark_draw_dirty(node):
+        # flag the cached draw data as out of date, and ask the viewport to prepare the node again
+        user_node = om.MFnDependencyNode(node).userNode()
+        if user_node is not None:
+            user_node.draw_version += 1
+
+        omr.MRenderer.setGeometryDrawDirty(node)
+
     @classmethod
     def creator(cls):
         return HelpTextNode()
@@ -49,6 +161,9 @@ class HelpTextNode(omui.MPxLocatorNode):
         
         cls.text_obj = text_attr.create('text_display', 'txt', om.MFnData.kString)
         
+        # when set, used instead of the text_display - placeholders like {ctrl.ikFk} or {ctrl.tx:.2f} and {time} show live values
+        cls.text_template_obj = text_attr.create('text_template', 'tmpl', om.MFnData.kString)
+        
         cls.text_size_obj = numeric_attr.create('text_size', 'size', om.MFnNumericData.kInt, 16)
         
         cls.text_align_obj = enum_attr.create('text_align', 'align', 1)
@@ -62,6 +177,11 @@ class HelpTextNode(omui.MPxLocatorNode):
         cls.text_coord_y_obj = numeric_attr.create('text_y_percentage', 'coordy', om.MFnNumericData.kInt)
         numeric_attr.keyable = True
         
+        # the width the text is wrapped at, as a percentage of the viewport width - 0 to not wrap
+        cls.text_max_width_obj = numeric_attr.create('text_max_width', 'maxw', om.MFnNumericData.kInt, 0)
+        numeric_attr.setMin(0)
+        numeric_attr.setMax(100)
+        
         cls.x_centre_obj = numeric_attr.create('centre_x_axis', 'centrex', om.MFnNumericData.kBoolean)
         cls.y_centre_obj = numeric_attr.create('centre_y_axis', 'centrey', om.MFnNumericData.kBoolean)
         
@@ -80,121 +200,321 @@ class HelpTextNode(omui.MPxLocatorNode):
         enum_attr.keyable = True
         enum_attr.hidden = False
         
+        # the entries - any number of extra lines of text, each with its own position, size, alignment and colour
+        compound_attr = om.MFnCompoundAttribute()
+        
+        cls.entry_text_obj = text_attr.create('entry_text', 'etxt', om.MFnData.kString)
+        
+        cls.entry_size_obj = numeric_attr.create('entry_size', 'esize', om.MFnNumericData.kInt, 16)
+        
+        cls.entry_coord_x_obj = numeric_attr.create('entry_x_percentage', 'ecoordx', om.MFnNumericData.kInt, 50)
+        numeric_attr.keyable = True
+        
+        cls.entry_coord_y_obj = numeric_attr.create('entry_y_percentage', 'ecoordy', om.MFnNumericData.kInt, 50)
+        numeric_attr.keyable = True
+        
+        cls.entry_max_width_obj = numeric_attr.create('entry_max_width', 'emaxw', om.MFnNumericData.kInt, 0)
+        numeric_attr.setMin(0)
+        numeric_attr.setMax(100)
+        
+        cls.entry_align_obj = enum_attr.create('entry_align', 'ealign', 1)
+        enum_attr.addField('Left', 0)
+        enum_attr.addField('Centre', 1)
+        enum_attr.addField('Right', 2)
+        
+        cls.entry_colour_obj = enum_attr.create('entry_colour', 'ecol', 1)
+        enum_attr.addField('black', 0)
+        enum_attr.addField('white', 1)
+        enum_attr.addField('red', 2)
+        enum_attr.addField('green', 3)
+        enum_attr.addField('blue', 4)
+        enum_attr.addField('yellow', 5)
+        enum_attr.addField('papaya', 6)
+        enum_attr.addField('pink', 7)
+        enum_attr.keyable = True
+        
+        cls.entries_obj = compound_attr.create('entries', 'ent')
+        compound_attr.addChild(cls.entry_text_obj)
+        compound_attr.addChild(cls.entry_size_obj)
+        compound_attr.addChild(cls.entry_coord_x_obj)
+        compound_attr.addChild(cls.entry_coord_y_obj)
+        compound_attr.addChild(cls.entry_max_width_obj)
+        compound_attr.addChild(cls.entry_align_obj)
+        compound_attr.addChild(cls.entry_colour_obj)
+        compound_attr.array = True
+        
         # add the attributes
         
         cls.addAttribute(cls.text_obj)
+        cls.addAttribute(cls.text_template_obj)
         cls.addAttribute(cls.text_size_obj)
         # cls.addAttribute(cls.text_weight_obj)
         cls.addAttribute(cls.text_align_obj)
         cls.addAttribute(cls.text_coord_x_obj)
         cls.addAttribute(cls.text_coord_y_obj)
+        cls.addAttribute(cls.text_max_width_obj)
         cls.addAttribute(cls.x_centre_obj)
         cls.addAttribute(cls.y_centre_obj)
         cls.addAttribute(cls.text_colour_enum_obj)
+        cls.addAttribute(cls.entries_obj)
         
 
+# the width of an average character, and the height of a line, as a ratio of the font size
+CHARACTER_WIDTH_RATIO = 0.6
+LINE_SPACING_RATIO = 1.3
+
+LAYOUT_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def layout_text(text, font_size, max_width):
+    '''
+    Splits the text into lines - at new lines, and by word wrapping to the max width in pixels (no wrapping if 0).
+
+    Returns a tuple of (line, y offset) pairs, with the block of lines centred on the text position
+    '''
+    # a new line typed into the attribute editor arrives as a backslash and an n
+    paragraphs = text.replace('\\n', '\n').split('\n')
+
+    if max_width > 0:
+        max_characters = max(1, int(max_width / (font_size * CHARACTER_WIDTH_RATIO)))
+        lines = []
+        for paragraph in paragraphs:
+            # keep empty lines, so blank lines can be used for spacing
+            lines.extend(textwrap.wrap(paragraph, max_characters) or [''])
+    else:
+        lines = paragraphs
+
+    line_height = font_size * LINE_SPACING_RATIO
+    top = (len(lines) - 1) * line_height / 2
+
+    return tuple((line, top - index * line_height) for index, line in enumerate(lines))
+
+
+TEMPLATE_TIME_FIELD = 'time'
+
+
+@functools.lru_cache(maxsize=LAYOUT_CACHE_SIZE)
+def compile_template(template):
+    '''
+    Parses a text template once - returns a tuple of (literal text, field, format spec), where the field is
+    'node.attribute', 'time' or None after the last literal
+    '''
+    return tuple((literal, field, spec) for literal, field, spec, conversion in string.Formatter().parse(template))
+
+
+class HelpTextEntry(object):
+    '''
+    One line of text drawn by a krHelpText node - either the main text_display, or one of the entries
+    '''
+
+    MAX_POSITIONS = 8
+
+    def __init__(self, text, size, align, colour, x_percentage, y_percentage, max_width_percentage, centre_x=False, centre_y=False):
+        self.text_to_display = text
+        self.text_size = size
+        self.text_align = align
+        self.text_colour = colour
+        self.text_x_percentage = x_percentage
+        self.text_y_percentage = y_percentage
+        self.max_width_percentage = max_width_percentage
+        self.centre_x = centre_x
+        self.centre_y = centre_y
+
+        # the pixel position of each line of text in each viewport size drawn so far - {(width, height): [(MPoint, line), ...]}
+        self.positions = {}
+
+    def lines(self, width, height):
+        # the pixel position of each line of text in a viewport of the given size, calculated once per viewport size
+        key = (width, height)
+        positions = self.positions.get(key)
+
+        if positions is None:
+            text_coord_x = (width / 100) * self.text_x_percentage
+            text_coord_y = (height / 100) * self.text_y_percentage
+
+            if self.centre_x:
+                text_coord_x = width / 2
+
+            if self.centre_y:
+                text_coord_y = height / 2
+
+            # only a handful of viewport sizes are expected (panels, tear offs, playblasts) - start again if there are more
+            if len(self.positions) >= HelpTextEntry.MAX_POSITIONS:
+                self.positions.clear()
+
+            max_width = int(width * self.max_width_percentage / 100)
+            layout = layout_text(self.text_to_display, self.text_size, max_width)
+
+            positions = [(om.MPoint(text_coord_x, text_coord_y + y_offset), line) for line, y_offset in layout]
+            self.positions[key] = positions
+
+        return positions
+
+
+class HelpTextData(om.MUserData):
+    '''
+    The draw data of one krHelpText node, reused from draw to draw until an attribute changes
+    '''
+
+    def __init__(self):
+        # False - the data is kept by the draw override, rather than deleted after each draw
+        super(HelpTextData, self).__init__(False)
+
+        # the node draw version the data was read at - None until read the first time
+        self.version = None
+
+        # the main text first, then the entries
+        self.entries = []
+
+        # the compiled text template, the plug of each field (None for the time, or a missing plug),
+        # and the field values the main text was last formatted with
+        self.template = None
+        self.template_plugs = []
+        self.template_values = None
+
+        # the template text last compiled, and whether a problem with it has been reported - a bad template is only reported once
+        self.template_text = None
+        self.reported = False
+
+
 class HelpTextDrawOverride(omr.MPxDrawOverride):
     
     NAME = "HelpTextDrawOverride"
     
     def __init__(self, obj):
-        super(HelpTextDrawOverride, self).__init__(obj, None, False)  
-        self.text_to_display = 'Well, hello there...'
-        self.text_col_r = 1
-        self.text_col_g = 1
-        self.text_col_b = 1
-        self.text_size = 16
-        self.text_align = 1
-        self.text_weight = 400
-        self.text_coord_x = 100
-        self.text_coord_y = 100
-        
+        # always dirty - the text is laid out again for each viewport drawn (a resized panel, a second panel or a playblast).
+        # prepareForDraw only reads the attributes again when the draw version has changed, so this stays cheap
+        super(HelpTextDrawOverride, self).__init__(obj, None, True)
     
     def prepareForDraw(self, obj_path, camera_path, frame_context, old_data):
         
-        view = omui.M3dView.active3dView()
-        width, height = view.portWidth(), view.portHeight()
+        node = obj_path.node()
+        user_node = om.MFnDependencyNode(node).userNode()
         
-        text_plug = om.MPlug(obj_path.node(), HelpTextNode.text_obj)
-        text_data = text_plug.asString()
-        self.text_to_display = text_data or ''
+        # reuse the data from the last draw
+        data = old_data
+        if not isinstance(data, HelpTextData):
+            data = HelpTextData()
         
-        size_plug = om.MPlug(obj_path.node(), HelpTextNode.text_size_obj)
-        size_data = size_plug.asInt()
-        self.text_size = size_data
+        # nothing has changed since the data was read - only the template values may need updating
+        if data.version == user_node.draw_version:
+            self.update_template(data, node)
+            return data
         
-        align_plug = om.MPlug(obj_path.node(), HelpTextNode.text_align_obj)
-        align_data = align_plug.asInt()
-        self.text_align = align_data
+        data.version = user_node.draw_version
         
+        # the main text
+        main_entry = HelpTextEntry(om.MPlug(node, HelpTextNode.text_obj).asString() or '',
+                                   om.MPlug(node, HelpTextNode.text_size_obj).asInt(),
+                                   HelpTextNode.ALIGNMENTS[om.MPlug(node, HelpTextNode.text_align_obj).asInt()],
+                                   HelpTextNode.PALETTE[om.MPlug(node, HelpTextNode.text_colour_enum_obj).asInt()],
+                                   om.MPlug(node, HelpTextNode.text_coord_x_obj).asInt(),
+                                   om.MPlug(node, HelpTextNode.text_coord_y_obj).asInt(),
+                                   om.MPlug(node, HelpTextNode.text_max_width_obj).asInt(),
+                                   om.MPlug(node, HelpTextNode.x_centre_obj).asBool(),
+                                   om.MPlug(node, HelpTextNode.y_centre_obj).asBool())
         
-        c_x_plug = om.MPlug(obj_path.node(), HelpTextNode.x_centre_obj)
-        c_x_data = c_x_plug.asBool()
+        data.entries = [main_entry]
         
-        c_y_plug = om.MPlug(obj_path.node(), HelpTextNode.y_centre_obj)
-        c_y_data = c_y_plug.asBool()
+        # the entries - only the elements that exist are read
+        entries_plug = om.MPlug(node, HelpTextNode.entries_obj)
         
-        coords_x_plug = om.MPlug(obj_path.node(), HelpTextNode.text_coord_x_obj)
-        coords_x_data = coords_x_plug.asInt()
-        self.text_coord_x = (width / 100) * coords_x_data
-        
-        
-        coords_y_plug = om.MPlug(obj_path.node(), HelpTextNode.text_coord_y_obj)
-        coords_y_data = coords_y_plug.asInt()
-        self.text_coord_y = (height / 100) * coords_y_data
-        
-        if c_x_data:
-            self.text_coord_x = width / 2
+        for index in range(entries_plug.numElements()):
+            entry_plug = entries_plug.elementByPhysicalIndex(index)
             
-        if c_y_data:
-            self.text_coord_y = height / 2
+            text = entry_plug.child(HelpTextNode.entry_text_obj).asString()
+            if not text:
+                continue
             
+            data.entries.append(HelpTextEntry(text,
+                                              entry_plug.child(HelpTextNode.entry_size_obj).asInt(),
+                                              HelpTextNode.ALIGNMENTS[entry_plug.child(HelpTextNode.entry_align_obj).asInt()],
+                                              HelpTextNode.PALETTE[entry_plug.child(HelpTextNode.entry_colour_obj).asInt()],
+                                              entry_plug.child(HelpTextNode.entry_coord_x_obj).asInt(),
+                                              entry_plug.child(HelpTextNode.entry_coord_y_obj).asInt(),
+                                              entry_plug.child(HelpTextNode.entry_max_width_obj).asInt()))
+        
+        # the text template - compiled, and its plugs found, only when it changes
+        template = om.MPlug(node, HelpTextNode.text_template_obj).asString()
+        
+        data.template = None
+        data.template_plugs = []
+        data.template_values = None
+        
+        if template != data.template_text:
+            data.template_text = template
+            data.reported = False
+        
+        if template:
+            # an unclosed brace - the text_display is drawn instead
+            try:
+                data.template = compile_template(template)
+            except ValueError as error:
+                self.report(data, node, 'text_template {0!r} - {1}'.format(template, error))
+            else:
+                data.template_plugs = [self.template_plug(field) for literal, field, spec in data.template]
         
+        # any field may be animated, so the time is watched whenever there are fields
+        user_node.watch_template(data.template_plugs, any(field for literal, field, spec in data.template or ()))
         
+        self.update_template(data, node)
         
-        colour_plug = om.MPlug(obj_path.node(), HelpTextNode.text_colour_enum_obj)
-        colour_data = colour_plug.asInt()
-        
-        if colour_data == 0:
-            self.text_col_r = 0
-            self.text_col_g = 0
-            self.text_col_b = 0
-        
-        if colour_data == 1:
-            self.text_col_r = 1
-            self.text_col_g = 1
-            self.text_col_b = 1
-        
-        if colour_data == 2:
-            self.text_col_r = 0.8
-            self.text_col_g = 0
-            self.text_col_b = 0
-        
-        if colour_data == 3:
-            self.text_col_r = 0
-            self.text_col_g = 0.8
-            self.text_col_b = 0
-        
-        if colour_data == 4:
-            self.text_col_r = 0
-            self.text_col_g = 0
-            self.text_col_b = 0.8
-        
-        if colour_data == 5:
-            self.text_col_r = 1
-            self.text_col_g = 1
-            self.text_col_b = 0
-        
-        if colour_data == 6:
-            self.text_col_r = 1
-            self.text_col_g = 0.5
-            self.text_col_b = 0
-        
-        if colour_data == 7:
-            self.text_col_r = 0.5
-            self.text_col_g = 0
-            self.text_col_b = 1
+        return data
+    
+    def template_plug(self, field):
+        # the plug for a 'node.attribute' field - None for the time, or if the plug does not exist
+        if not field or field == TEMPLATE_TIME_FIELD:
+            return None
         
+        selection_list = om.MSelectionList()
+        try:
+            selection_list.add(field)
+            return selection_list.getPlug(0)
+        except:
+            return None
+    
+    @staticmethod
+    def report(data, node, message):
+        # called for every draw while the template is bad, so only the first is shown
+        if not data.reported:
+            om.MGlobal.displayWarning('{0}: {1}'.format(om.MFnDependencyNode(node).name(), message))
+            data.reported = True
+    
+    def update_template(self, data, node):
+        # only the plugs used by the template are read, and the text is only formatted again if a value has changed
+        if data.template is None:
+            return
+        
+        values = []
+        
+        for (literal, field, spec), plug in zip(data.template, data.template_plugs):
+            if not field:
+                values.append('')
+            elif field != TEMPLATE_TIME_FIELD and (plug is None or plug.isNull):
+                values.append('?')
+            else:
+                # a format spec that does not suit the value ({ctrl.tx:d}, or any spec on a string) shows as '?'
+                try:
+                    if field == TEMPLATE_TIME_FIELD:
+                        values.append(format(om.MAnimControl.currentTime().value, spec or 'g'))
+                    elif spec:
+                        values.append(format(plug.asDouble(), spec))
+                    else:
+                        values.append(plug_value_text(plug))
+                except (ValueError, TypeError, RuntimeError) as error:
+                    self.report(data, node, 'text_template field {{{0}:{1}}} - {2}'.format(field, spec, error))
+                    values.append('?')
+        
+        values = tuple(values)
+        if values == data.template_values:
+            return
+        
+        data.template_values = values
+        
+        main_entry = data.entries[0]
+        main_entry.text_to_display = ''.join(literal + value for (literal, field, spec), value in zip(data.template, values))
+        main_entry.positions.clear()
         
     def supportedDrawAPIs(self):
         return omr.MRenderer.kAllDevices
@@ -203,19 +523,31 @@ class HelpTextDrawOverride(omr.MPxDrawOverride):
         return True
     
     def addUIDrawables(self, obj_path, draw_manager, frame_context, data):
-        text_colour = om.MColor((self.text_col_r, self.text_col_g, self.text_col_b, 1))
         
+        # the size of the viewport being drawn - not the active one, which may be a different panel or not exist in a batch playblast
+        width, height = frame_context.getViewportDimensions()[2:]
+        
+        # every entry is drawn in the one drawable - the colour and size are only set when they change
+        colour = None
+        size = None
         
         draw_manager.beginDrawable()
-        draw_manager.setColor(text_colour)
-        draw_manager.setFontSize(self.text_size)
-        # draw_manager.setFontWeight(self.text_weight)
-        if self.text_align == 0:
-            draw_manager.text2d(om.MPoint(self.text_coord_x, self.text_coord_y), self.text_to_display, omr.MUIDrawManager.kLeft)
-        if self.text_align == 1:
-            draw_manager.text2d(om.MPoint(self.text_coord_x, self.text_coord_y), self.text_to_display, omr.MUIDrawManager.kCenter)
-        if self.text_align == 2:
-            draw_manager.text2d(om.MPoint(self.text_coord_x, self.text_coord_y), self.text_to_display, omr.MUIDrawManager.kRight)
+        
+        for entry in data.entries:
+            if not entry.text_to_display:
+                continue
+            
+            if entry.text_colour is not colour:
+                colour = entry.text_colour
+                draw_manager.setColor(colour)
+            
+            if entry.text_size != size:
+                size = entry.text_size
+                draw_manager.setFontSize(size)
+            
+            # draw_manager.setFontWeight(self.text_weight)
+            for position, line in entry.lines(width, height):
+                draw_manager.text2d(position, line, entry.text_align)
         
         draw_manager.endDrawable()
         
@@ -225,248 +557,2731 @@ class HelpTextDrawOverride(omr.MPxDrawOverride):
 
 
 
-##########################
-### Node:  krCondition ###
-##########################
+######################
+### Node:  krLabel ###
+######################
 '''
-Use:    Node Editor
+Use:    Node Editor.  Connect the message of each object to be labelled into targets, or the message of an object set into object_set
 
-Plugs Input:        Operation   - whether Equal to, not equal to, greater than, greater than or equal to, less than, less than or equal to
+Plugs Input:        targets         message[]   the objects to label
+                    object_set      message     an object set - every DAG member is labelled
 
-Plugs Output:       Result
+Plugs Output:       None
 
-Node Attributes:    Value if true   - the value output if the condition is true
-                    Value if false  - the value output if the value is false
-                    
+Node Attributes:    label_attribute String      the attribute value to show on each object - the object name if empty
+                    text_size       int         size of the labels
+                    colour          enum        black, white, red, green, blue, yellow, papaya, pink
+                    max_distance    double      labels further than this from the camera are not drawn - 0 for no limit
+                    declutter       bool        labels that overlap a closer label are drawn as a point instead of text
+
+The world position of each target is only read again when it moves - on playback, only the targets driven by the time
+(keyed, or below a keyed parent) are read, so the cost of a frame follows the animated targets, not every label
 '''
 
-class AttrCheckNode(om.MPxNode):
+class LabelNode(omui.MPxLocatorNode):
+
+    TYPE_NAME = "krLabel"
+    TYPE_ID = om.MTypeId(0x0007f7fa)
+    DRAW_CLASSIFICATION = 'drawdb/geometry/krLabel'
+    DRAW_REGISTRANT_ID = 'LabelNode'
 
-    TYPE_NAME = "krCondition"
-    TYPE_ID = om.MTypeId(0x0007F7F8)
-    
-    term_one_obj = None
-    term_two_obj = None
-    value_true_obj = None
-    value_false_obj = None
-    operation_obj = None
-    result_obj = None
-    
     def __init__(self):
-        super(AttrCheckNode, self).__init__()
-    
-    def compute(self, plug, data):
-        
-        # when the node is dirty
-        if plug == AttrCheckNode.result_obj:
-            
-            # get the required values
-            term_one = data.inputValue(AttrCheckNode.term_one_obj).asDouble()
-            term_two = data.inputValue(AttrCheckNode.term_two_obj).asDouble()
-            
-            value_true = data.inputValue(AttrCheckNode.value_true_obj).asDouble()
-            value_false = data.inputValue(AttrCheckNode.value_false_obj).asDouble()
-            
-            operation = data.inputValue(AttrCheckNode.operation_obj).asInt()
-            
-            # set the result value
-            
-            result = 0.0
-            
-            if operation == 0:
-                if term_one == term_two:
-                    result = value_true
-                else:
-                    result = value_false
-                    
-            if operation == 1:
-                if term_one != term_two:
-                    result = value_true
-                else:
-                    result = value_false
-                    
-            if operation == 2:
-                if term_one > term_two:
-                    result = value_true
-                else:
-                    result = value_false
-                    
-            if operation == 3:
-                if term_one >= term_two:
-                    result = value_true
-                else:
-                    result = value_false
-                    
-            if operation == 4:
-                if term_one < term_two:
-                    result = value_true
-                else:
-                    result = value_false
-                    
-            if operation == 5:
-                if term_one <= term_two:
-                    result = value_true
-                else:
-                    result = value_false
-                    
-            
-            output_data = data.outputValue(AttrCheckNode.result_obj)
-            output_data.setDouble(result)
+        super(LabelNode, self).__init__()
+
+        # incremented whenever an attribute or connection changes, so the draw override knows to resolve the targets again
+        self.draw_version = 0
+        self.callback_ids = []
+
+        # the callback on the connected object set, so changes to its members are picked up
+        self.set_callback_id = None
+        self.set_handle = None
+
+        # the callbacks on the targets and the time, the targets that follow the time, and the targets that have moved
+        # since the last draw (by index) - the draw override only reads the world position of these again
+        self.target_callback_ids = []
+        self.time_targets = []
+        self.moved = set()
+
+    def postConstructor(self):
+        self.callback_ids.append(om.MNodeMessage.addAttributeChangedCallback(self.thisMObject(), HelpTextNode.attribute_changed))
+
+    def __del__(self):
+        for callback_id in self.callback_ids + self.target_callback_ids + [self.set_callback_id]:
+            try:
+                om.MMessage.removeCallback(callback_id)
+            except:
+                pass
+
+    def watch_set(self, set_obj):
+        # listen for membership changes on the connected object set - only one set is watched at a time
+        if set_obj is not None and self.set_handle is not None and self.set_handle.object() == set_obj:
+            return
+
+        if self.set_callback_id is not None:
+            om.MMessage.removeCallback(self.set_callback_id)
+            self.set_callback_id = None
+            self.set_handle = None
+
+        if set_obj is not None:
+            self.set_handle = om.MObjectHandle(set_obj)
+            self.set_callback_id = om.MNodeMessage.addAttributeChangedCallback(set_obj, LabelNode.set_changed, self.thisMObject())
+
+    @staticmethod
+    def set_changed(msg, plug, other_plug, label_obj):
+        if msg & (om.MNodeMessage.kConnectionMade | om.MNodeMessage.kConnectionBroken):
+            HelpTextNode.mark_draw_dirty(label_obj)
+
+    def watch_targets(self, dag_paths):
+        # listen for each target's world matrix changing - the index of the target is passed along, so only it is read again
+        for callback_id in self.target_callback_ids:
+            try:
+                om.MMessage.removeCallback(callback_id)
+            except:
+                # the target has been deleted
+                pass
+        self.target_callback_ids = []
+
+        self.time_targets = []
+        self.moved = set()
+
+        if not dag_paths:
+            return
+
+        node = self.thisMObject()
+
+        for index, dag_path in enumerate(dag_paths):
+            self.target_callback_ids.append(om.MDagMessage.addWorldMatrixModifiedCallback(dag_path, LabelNode.target_moved, (node, index)))
+
+        # the evaluation manager does not dirty the world matrices as the time changes, so animated targets may not send
+        # a callback - the targets that follow the time (or have a parent that does) are read again on a time change.
+        # The rest only move when edited, which the callbacks above catch
+        driven = {}
+        self.time_targets = [index for index, dag_path in enumerate(dag_paths) if LabelNode.follows_time(dag_path, driven)]
+
+        if self.time_targets:
+            self.target_callback_ids.append(om.MDGMessage.addTimeChangeCallback(LabelNode.time_changed, node))
+
+        # a target that is keyed (or connected to the time) later is found by resolving the targets again
+        self.target_callback_ids.append(om.MDGMessage.addConnectionCallback(LabelNode.connection_changed, node))
+
+    @staticmethod
+    def follows_time(dag_path, driven):
+        # whether the node or any of its parents is driven by the time - driven caches the answer for each node by hash code
+        path = om.MDagPath(dag_path)
+
+        while path.length() > 0:
+            path_obj = path.node()
+            node_hash = om.MObjectHandle(path_obj).hashCode()
+
+            if node_hash not in driven:
+                driven[node_hash] = LabelNode.driven_by_time(path_obj, driven)
+            if driven[node_hash]:
+                return True
+
+            path.pop()
+
+        return False
+
+    @staticmethod
+    def driven_by_time(node, driven):
+        # an animation curve keyed in time, or the time node (expressions, motion paths etc), anywhere upstream of the node.
+        # Nodes already checked are not searched again - the rigs of many targets share most of their upstream graph
+        graph_iter = om.MItDependencyGraph(node, om.MFn.kInvalid, om.MItDependencyGraph.kUpstream,
+                                           om.MItDependencyGraph.kBreadthFirst, om.MItDependencyGraph.kNodeLevel)
+
+        while not graph_iter.isDone():
+            current = graph_iter.currentNode()
+
+            if LabelNode.is_time_source(current):
+                return True
+
+            checked = driven.get(om.MObjectHandle(current).hashCode())
+            if checked:
+                return True
+            if checked is False and current != node:
+                graph_iter.prune()
+
+            graph_iter.next()
+
+        return False
+
+    @staticmethod
+    def is_time_source(node):
+        return (node.hasFn(om.MFn.kTime) or node.hasFn(om.MFn.kAnimCurveTimeToAngular) or node.hasFn(om.MFn.kAnimCurveTimeToDistance)
+                or node.hasFn(om.MFn.kAnimCurveTimeToUnitless) or node.hasFn(om.MFn.kAnimCurveTimeToTime))
+
+    @staticmethod
+    def connection_changed(source_plug, destination_plug, made, label_obj):
+        if made and LabelNode.is_time_source(source_plug.node()):
+            HelpTextNode.mark_draw_dirty(label_obj)
+
+    @staticmethod
+    def target_moved(transform_obj, modified, client_data):
+        label_obj, index = client_data
+        user_node = om.MFnDependencyNode(label_obj).userNode()
+        if user_node is not None:
+            user_node.moved.add(index)
+
+    @staticmethod
+    def time_changed(time, label_obj):
+        user_node = om.MFnDependencyNode(label_obj).userNode()
+        if user_node is not None:
+            user_node.moved.update(user_node.time_targets)
 
-            
     @classmethod
     def creator(cls):
-        return AttrCheckNode()
-        
+        return LabelNode()
+
     @classmethod
     def initialize(cls):
-    
+
+        message_attr = om.MFnMessageAttribute()
+        text_attr = om.MFnTypedAttribute()
         numeric_attr = om.MFnNumericAttribute()
         enum_attr = om.MFnEnumAttribute()
-        
-        # term one        
-        cls.term_one_obj = numeric_attr.create('term_one', 'one', om.MFnNumericData.kDouble, 0.0)
-        numeric_attr.keyable = True
-        numeric_attr.readable = False
-        
-        # term two
-        cls.term_two_obj = numeric_attr.create('term_two', 'two', om.MFnNumericData.kDouble, 0.0)
-        numeric_attr.keyable = True
-        numeric_attr.readable = False
-        
-        # value if true
-        cls.value_true_obj = numeric_attr.create('value_true', 'true', om.MFnNumericData.kDouble, 0.0)
-        numeric_attr.keyable = True
-        numeric_attr.readable = False        
 
-        # value if false
-        cls.value_false_obj = numeric_attr.create('value_false', 'false', om.MFnNumericData.kDouble, 0.0)
-        numeric_attr.keyable = True
-        numeric_attr.readable = False
+        cls.targets_obj = message_attr.create('targets', 'tgt')
+        message_attr.array = True
+        message_attr.indexMatters = False
 
-        # operation enum
-        cls.operation_obj = enum_attr.create('operation', 'op', 0)
-        enum_attr.keyable = True
-        enum_attr.readable = False
-        
-        enum_attr.addField('equal', 0)
-        enum_attr.addField('not equal', 1)
-        enum_attr.addField('greater than', 2)
-        enum_attr.addField('greater then or equal', 3)
-        enum_attr.addField('less than', 4)
-        enum_attr.addField('less than or equal', 5)
-        
-        # output node
-        cls.result_obj = numeric_attr.create('result', 'res', om.MFnNumericData.kDouble, 0.0)
-        numeric_attr.writable = False
-        
-        # add attributes
-        cls.addAttribute(cls.term_one_obj)
-        cls.addAttribute(cls.operation_obj)
-        cls.addAttribute(cls.term_two_obj)
-        cls.addAttribute(cls.value_true_obj)
-        cls.addAttribute(cls.value_false_obj)
-        cls.addAttribute(cls.result_obj)     
-        
-        # affects
-        cls.attributeAffects(cls.term_one_obj, cls.result_obj)
-        cls.attributeAffects(cls.term_two_obj, cls.result_obj)
-        cls.attributeAffects(cls.value_true_obj, cls.result_obj)
-        cls.attributeAffects(cls.value_false_obj, cls.result_obj)
-        cls.attributeAffects(cls.operation_obj, cls.result_obj)
-        
-    
-##########################################
-### Basic Node:  krMultiEqualCondition ###
-##########################################
-'''
-Use:    Node Editor
+        cls.object_set_obj = message_attr.create('object_set', 'set')
 
-Plugs Input:        Input
+        cls.label_attribute_obj = text_attr.create('label_attribute', 'lattr', om.MFnData.kString)
 
-Plugs Output:       Output
+        cls.text_size_obj = numeric_attr.create('text_size', 'size', om.MFnNumericData.kInt, 12)
 
-Node Attributes:    Check 00 to Check 09
-                    First:  the number to check
-                    Second: the output if a match
-                    
+        cls.max_distance_obj = numeric_attr.create('max_distance', 'maxd', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.setMin(0.0)
+
+        cls.declutter_obj = numeric_attr.create('declutter', 'dcl', om.MFnNumericData.kBoolean, True)
+
+        cls.text_colour_enum_obj = enum_attr.create('colour', 'col', 5)
+        enum_attr.addField('black', 0)
+        enum_attr.addField('white', 1)
+        enum_attr.addField('red', 2)
+        enum_attr.addField('green', 3)
+        enum_attr.addField('blue', 4)
+        enum_attr.addField('yellow', 5)
+        enum_attr.addField('papaya', 6)
+        enum_attr.addField('pink', 7)
+        enum_attr.keyable = True
+
+        # add the attributes
+        cls.addAttribute(cls.targets_obj)
+        cls.addAttribute(cls.object_set_obj)
+        cls.addAttribute(cls.label_attribute_obj)
+        cls.addAttribute(cls.text_size_obj)
+        cls.addAttribute(cls.max_distance_obj)
+        cls.addAttribute(cls.declutter_obj)
+        cls.addAttribute(cls.text_colour_enum_obj)
+
+
+def plug_value_text(plug):
+    # the value of a plug as text, for the labels
+    attr = plug.attribute()
+    attr_type = attr.apiType()
+
+    if attr_type == om.MFn.kTypedAttribute:
+        return plug.asString()
+
+    if attr_type == om.MFn.kEnumAttribute:
+        return om.MFnEnumAttribute(attr).fieldName(plug.asShort())
+
+    if attr_type == om.MFn.kDoubleAngleAttribute:
+        return '{0:g}'.format(plug.asMAngle().asDegrees())
+
+    if attr_type == om.MFn.kNumericAttribute and om.MFnNumericAttribute(attr).numericType() == om.MFnNumericData.kBoolean:
+        return 'on' if plug.asBool() else 'off'
+
+    return '{0:g}'.format(plug.asDouble())
+
+
+class LabelData(om.MUserData):
+    '''
+    The draw data of one krLabel node.  The targets are resolved only when the connections change, and their world
+    positions only read again when they move.  The visible labels are worked out every draw
+    '''
+
+    def __init__(self):
+        super(LabelData, self).__init__(False)
+
+        # the node draw version the targets were resolved at - None until resolved the first time
+        self.version = None
+
+        # (dag path, name, label plug or None) for every target
+        self.targets = []
+
+        # the world position of every target - an (N, 4) array of homogeneous points with numpy (nan for a deleted target),
+        # otherwise a list of MPoints (None for a deleted target)
+        self.positions = []
+
+        self.text_size = 12
+        self.text_colour = HelpTextNode.PALETTE[5]
+        self.max_distance = 0.0
+        self.declutter = True
+
+        # filled in each draw - (world position, text) for the full labels, and the positions of the reduced ones
+        self.labels = []
+        self.reduced = om.MPointArray()
+
+
+class LabelDrawOverride(omr.MPxDrawOverride):
+
+    NAME = "LabelDrawOverride"
+
+    def __init__(self, obj):
+        # always dirty - the labels are culled again whenever the camera moves
+        super(LabelDrawOverride, self).__init__(obj, None, True)
+
+    def prepareForDraw(self, obj_path, camera_path, frame_context, old_data):
+
+        node = obj_path.node()
+        user_node = om.MFnDependencyNode(node).userNode()
+
+        data = old_data
+        if not isinstance(data, LabelData):
+            data = LabelData()
+
+        # resolve the targets only when an attribute or connection has changed
+        if data.version != user_node.draw_version:
+            data.version = user_node.draw_version
+            self.resolve_targets(node, user_node, data)
+
+        # read the positions of the targets that have moved
+        elif user_node.moved:
+            self.read_positions(data, user_node.moved)
+
+        user_node.moved = set()
+
+        if np is not None:
+            self.find_visible(frame_context, data)
+        else:
+            self.find_visible_api(frame_context, data)
+
+        return data
+
+    def resolve_targets(self, node, user_node, data):
+        data.text_size = om.MPlug(node, LabelNode.text_size_obj).asInt()
+        data.text_colour = HelpTextNode.PALETTE[om.MPlug(node, LabelNode.text_colour_enum_obj).asInt()]
+        data.max_distance = om.MPlug(node, LabelNode.max_distance_obj).asDouble()
+        data.declutter = om.MPlug(node, LabelNode.declutter_obj).asBool()
+        label_attribute = om.MPlug(node, LabelNode.label_attribute_obj).asString()
+
+        dag_paths = []
+
+        # the objects connected to the targets
+        targets_plug = om.MPlug(node, LabelNode.targets_obj)
+        for index in range(targets_plug.numElements()):
+            for source_plug in targets_plug.elementByPhysicalIndex(index).connectedTo(True, False):
+                source_obj = source_plug.node()
+                if source_obj.hasFn(om.MFn.kDagNode):
+                    dag_paths.append(om.MDagPath.getAPathTo(source_obj))
+
+        # the DAG members of the connected object set
+        set_obj = None
+        for source_plug in om.MPlug(node, LabelNode.object_set_obj).connectedTo(True, False):
+            if source_plug.node().hasFn(om.MFn.kSet):
+                set_obj = source_plug.node()
+
+        user_node.watch_set(set_obj)
+
+        if set_obj is not None:
+            members = om.MFnSet(set_obj).getMembers(True)
+            for index in range(members.length()):
+                try:
+                    dag_paths.append(members.getDagPath(index))
+                except:
+                    # not a DAG member
+                    pass
+
+        # each object is only labelled once
+        data.targets = []
+        found = set()
+
+        for dag_path in dag_paths:
+            full_path = dag_path.fullPathName()
+            if full_path in found:
+                continue
+            found.add(full_path)
+
+            depend_fn = om.MFnDependencyNode(dag_path.node())
+            label_plug = None
+
+            if label_attribute and depend_fn.hasAttribute(label_attribute):
+                label_plug = depend_fn.findPlug(label_attribute, False)
+
+            data.targets.append((dag_path, depend_fn.name(), label_plug))
+
+        user_node.watch_targets([dag_path for dag_path, name, label_plug in data.targets])
+
+        # every position is read once here, then only as the targets move
+        if np is not None:
+            data.positions = np.full((len(data.targets), 4), np.nan)
+        else:
+            data.positions = [None] * len(data.targets)
+
+        self.read_positions(data, range(len(data.targets)))
+
+    def read_positions(self, data, indices):
+        for index in indices:
+            dag_path = data.targets[index][0]
+
+            if not dag_path.isValid():
+                position = None
+            else:
+                position = om.MPoint() * dag_path.inclusiveMatrix()
+
+            if np is None:
+                data.positions[index] = position
+            elif position is None:
+                data.positions[index] = np.nan
+            else:
+                data.positions[index] = (position.x, position.y, position.z, 1.0)
+
+    def find_visible(self, frame_context, data):
+        # project every target at once, keeping only the ones in front of the camera, inside the view and within the max distance.
+        # Only the visible labels are looped over
+        data.labels = []
+        data.reduced.clear()
+
+        if not data.targets:
+            return
+
+        view_projection = np.array(list(frame_context.getMatrix(omr.MFrameContext.kViewProjMtx))).reshape(4, 4)
+        view_position = frame_context.getTuple(omr.MFrameContext.kViewPosition)
+        width, height = frame_context.getViewportDimensions()[2:]
+
+        positions = data.positions
+
+        # frustum culling, in clip space - the nan of a deleted target fails every test
+        clip = positions.dot(view_projection)
+        clip_w = clip[:, 3]
+        in_view = (clip_w > 0.0) & (np.abs(clip[:, 0]) <= clip_w) & (np.abs(clip[:, 1]) <= clip_w)
+
+        # distance culling
+        distance = np.linalg.norm(positions[:, :3] - np.array((view_position[0], view_position[1], view_position[2])), axis=1)
+        if data.max_distance > 0.0:
+            in_view &= distance <= data.max_distance
+
+        # closest first, so the closest label wins when labels overlap
+        visible = np.flatnonzero(in_view)
+        visible = visible[np.argsort(distance[visible], kind='stable')]
+
+        # the screen is split into cells about the size of a label - only the first label in each cell is drawn as text
+        drawn = np.ones(len(visible), dtype=bool)
+
+        if data.declutter and len(visible):
+            clip = clip[visible]
+            screen_x = (clip[:, 0] / clip[:, 3] * 0.5 + 0.5) * width
+            screen_y = (clip[:, 1] / clip[:, 3] * 0.5 + 0.5) * height
+
+            cell_width = max(1.0, data.text_size * CHARACTER_WIDTH_RATIO * 8)
+            cell_height = max(1.0, data.text_size * LINE_SPACING_RATIO)
+            cells = np.stack((screen_x // cell_width, screen_y // cell_height), axis=1)
+
+            drawn[:] = False
+            drawn[np.unique(cells, axis=0, return_index=True)[1]] = True
+
+        for index, draw in zip(visible.tolist(), drawn.tolist()):
+            position = om.MPoint(*positions[index, :3].tolist())
+            if not draw:
+                data.reduced.append(position)
+                continue
+
+            # the attribute values are only read for the labels that are drawn
+            dag_path, name, label_plug = data.targets[index]
+            text = name
+            if label_plug is not None:
+                text = plug_value_text(label_plug)
+
+            data.labels.append((position, text))
+
+    def find_visible_api(self, frame_context, data):
+        # the same as find_visible, one target at a time
+        view_projection = frame_context.getMatrix(omr.MFrameContext.kViewProjMtx)
+        view_position = frame_context.getTuple(omr.MFrameContext.kViewPosition)
+        camera_position = om.MPoint(view_position[0], view_position[1], view_position[2])
+        width, height = frame_context.getViewportDimensions()[2:]
+
+        visible = []
+
+        for (dag_path, name, label_plug), position in zip(data.targets, data.positions):
+            if position is None:
+                continue
+
+            # frustum culling, in clip space
+            clip = position * view_projection
+            if clip.w <= 0.0 or abs(clip.x) > clip.w or abs(clip.y) > clip.w:
+                continue
+
+            # distance culling
+            distance = position.distanceTo(camera_position)
+            if data.max_distance > 0.0 and distance > data.max_distance:
+                continue
+
+            # the pixel position, for the overlap test
+            screen_x = (clip.x / clip.w * 0.5 + 0.5) * width
+            screen_y = (clip.y / clip.w * 0.5 + 0.5) * height
+
+            visible.append((distance, position, screen_x, screen_y, name, label_plug))
+
+        data.labels = []
+        data.reduced.clear()
+
+        # closest first, so the closest label wins when labels overlap
+        visible.sort(key=lambda item: item[0])
+
+        # the screen is split into cells about the size of a label - only the first label in each cell is drawn as text
+        cell_width = max(1.0, data.text_size * CHARACTER_WIDTH_RATIO * 8)
+        cell_height = max(1.0, data.text_size * LINE_SPACING_RATIO)
+        used_cells = set()
+
+        for distance, position, screen_x, screen_y, name, label_plug in visible:
+            if data.declutter:
+                cell = (int(screen_x // cell_width), int(screen_y // cell_height))
+                if cell in used_cells:
+                    data.reduced.append(position)
+                    continue
+                used_cells.add(cell)
+
+            # the attribute values are only read for the labels that are drawn
+            text = name
+            if label_plug is not None:
+                text = plug_value_text(label_plug)
+
+            data.labels.append((position, text))
+
+    def supportedDrawAPIs(self):
+        return omr.MRenderer.kAllDevices
+
+    def hasUIDrawables(self):
+        return True
+
+    def addUIDrawables(self, obj_path, draw_manager, frame_context, data):
+        # every visible label is drawn in the one drawable
+        draw_manager.beginDrawable()
+        draw_manager.setColor(data.text_colour)
+        draw_manager.setFontSize(data.text_size)
+
+        for position, text in data.labels:
+            draw_manager.text(position, text, omr.MUIDrawManager.kCenter)
+
+        if len(data.reduced):
+            draw_manager.setPointSize(3)
+            draw_manager.points(data.reduced, False)
+
+        draw_manager.endDrawable()
+
+    @classmethod
+    def creator(cls, obj):
+        return LabelDrawOverride(obj)
+
+
+
+##########################
+### Node:  krCondition ###
+##########################
 '''
+Use:    Node Editor
 
-class ConvertInputNode(om.MPxNode):
+Plugs Input:        Operation   - whether Equal to, not equal to, greater than, greater than or equal to, less than, less than or equal to
 
-    TYPE_NAME = "krMultiEqualCondition"
-    TYPE_ID = om.MTypeId(0x0007F7F7)
+Plugs Output:       Result
+
+Node Attributes:    Value if true   - the value output if the condition is true
+                    Value if false  - the value output if the value is false
+                    
+                    Value true vector / value false vector / result vector      - the same for a double3, colours, positions etc
+                    Value true matrix / value false matrix / result matrix      - the same for a matrix
+                    
+'''
+
+# the operation enum values, as functions - these work on single values and numpy arrays alike
+OPERATIONS = (operator.eq, operator.ne, operator.gt, operator.ge, operator.lt, operator.le)
+
+
+class AttrCheckNode(om.MPxNode):
+
+    TYPE_NAME = "krCondition"
+    TYPE_ID = om.MTypeId(0x0007F7F8)
     
-    input_obj = None
-    output_obj = None
+    term_one_obj = None
+    term_two_obj = None
+    value_true_obj = None
+    value_false_obj = None
+    operation_obj = None
+    result_obj = None
+    
+    value_true_vector_obj = None
+    value_false_vector_obj = None
+    result_vector_obj = None
+    
+    value_true_matrix_obj = None
+    value_false_matrix_obj = None
+    result_matrix_obj = None
     
     def __init__(self):
-        super(ConvertInputNode, self).__init__()
+        super(AttrCheckNode, self).__init__()
+    
+    def schedulingType(self):
+        # compute only reads the data block, and there is no state shared between nodes - safe for parallel evaluation and cached playback
+        return om.MPxNode.kParallel
     
     def compute(self, plug, data):
+        
+        # the children of the result vector are computed with it
+        if plug.isChild:
+            plug = plug.parent()
+        
         # when the node is dirty
-        if plug == ConvertInputNode.output_obj:
+        if plug == AttrCheckNode.result_obj or plug == AttrCheckNode.result_vector_obj or plug == AttrCheckNode.result_matrix_obj:
+            
+            # get the required values
+            term_one = data.inputValue(AttrCheckNode.term_one_obj).asDouble()
+            term_two = data.inputValue(AttrCheckNode.term_two_obj).asDouble()
             
-            # set the initial output var - if no match, 0.0 will be the output
-            my_output = 0.0
+            operation = OPERATIONS[data.inputValue(AttrCheckNode.operation_obj).asInt()]
             
-            # get the input variable
-            my_input = data.inputValue(ConvertInputNode.input_obj).asDouble()
+            # the one comparison picks the value for every result - only the picked value is read
+            condition = operation(term_one, term_two)
+            
+            # set the result value
+            if plug == AttrCheckNode.result_obj:
+                value_obj = AttrCheckNode.value_true_obj if condition else AttrCheckNode.value_false_obj
+                
+                output_data = data.outputValue(AttrCheckNode.result_obj)
+                output_data.setDouble(data.inputValue(value_obj).asDouble())
+            
+            elif plug == AttrCheckNode.result_vector_obj:
+                value_obj = AttrCheckNode.value_true_vector_obj if condition else AttrCheckNode.value_false_vector_obj
+                
+                output_data = data.outputValue(AttrCheckNode.result_vector_obj)
+                output_data.set3Double(*data.inputValue(value_obj).asDouble3())
             
-            # used to stop checking incase of duplicates - will stop when the first match is found.
-            match_found = False
+            else:
+                value_obj = AttrCheckNode.value_true_matrix_obj if condition else AttrCheckNode.value_false_matrix_obj
+                
+                output_data = data.outputValue(AttrCheckNode.result_matrix_obj)
+                output_data.setMMatrix(data.inputValue(value_obj).asMatrix())
 
-            for index in range(10):
-                if not match_found:
-                    # get the data
-                    check_attr_name = f"check_0{str(index)}"
-                    my_check_data = data.inputValue(getattr(ConvertInputNode, check_attr_name)).asDouble2()
-                    my_check = my_check_data[0]
-                    my_result = my_check_data[1]
-                    
-                    # check the data
-                    if my_input == my_check:
-                        my_output = my_result
-                        match_found = True
             
-            # set the outputs        
-            output_data_handle = data.outputValue(ConvertInputNode.output_obj)
-            output_data_handle.setDouble(my_output)
-        
     @classmethod
     def creator(cls):
-        return ConvertInputNode()
+        return AttrCheckNode()
         
     @classmethod
     def initialize(cls):
     
         numeric_attr = om.MFnNumericAttribute()
+        enum_attr = om.MFnEnumAttribute()
         
-        # input node
-        cls.input_obj = numeric_attr.create('input', 'inp', om.MFnNumericData.kDouble, 0.0)
+        # term one        
+        cls.term_one_obj = numeric_attr.create('term_one', 'one', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+        
+        # term two
+        cls.term_two_obj = numeric_attr.create('term_two', 'two', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+        
+        # value if true
+        cls.value_true_obj = numeric_attr.create('value_true', 'true', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False        
+
+        # value if false
+        cls.value_false_obj = numeric_attr.create('value_false', 'false', om.MFnNumericData.kDouble, 0.0)
         numeric_attr.keyable = True
         numeric_attr.readable = False
+
+        # operation enum
+        cls.operation_obj = enum_attr.create('operation', 'op', 0)
+        enum_attr.keyable = True
+        enum_attr.readable = False
+        
+        enum_attr.addField('equal', 0)
+        enum_attr.addField('not equal', 1)
+        enum_attr.addField('greater than', 2)
+        enum_attr.addField('greater then or equal', 3)
+        enum_attr.addField('less than', 4)
+        enum_attr.addField('less than or equal', 5)
         
         # output node
-        cls.output_obj = numeric_attr.create('output', 'out', om.MFnNumericData.kDouble, 0.0)
+        cls.result_obj = numeric_attr.create('result', 'res', om.MFnNumericData.kDouble, 0.0)
         numeric_attr.writable = False
         
+        # the vector values - X, Y and Z children
+        for attr_name, short_name in (('value_true_vector', 'tvec'), ('value_false_vector', 'fvec'), ('result_vector', 'rvec')):
+            children = [numeric_attr.create(attr_name + axis, short_name + axis.lower(), om.MFnNumericData.kDouble, 0.0) for axis in 'XYZ']
+            
+            attr_obj = numeric_attr.create(attr_name, short_name, *children)
+            numeric_attr.keyable = True
+            numeric_attr.readable = False
+            setattr(cls, attr_name + '_obj', attr_obj)
+        
+        # the result vector is the last one created - an output
+        numeric_attr.keyable = False
+        numeric_attr.readable = True
+        numeric_attr.writable = False
+        
+        # the matrix values
+        matrix_attr = om.MFnMatrixAttribute()
+        
+        for attr_name, short_name in (('value_true_matrix', 'tmat'), ('value_false_matrix', 'fmat')):
+            setattr(cls, attr_name + '_obj', matrix_attr.create(attr_name, short_name, om.MFnMatrixAttribute.kDouble))
+            matrix_attr.readable = False
+        
+        cls.result_matrix_obj = matrix_attr.create('result_matrix', 'rmat', om.MFnMatrixAttribute.kDouble)
+        matrix_attr.writable = False
+        matrix_attr.storable = False
+        
         # add attributes
-        cls.addAttribute(cls.input_obj)
-        cls.addAttribute(cls.output_obj)        
+        cls.addAttribute(cls.term_one_obj)
+        cls.addAttribute(cls.operation_obj)
+        cls.addAttribute(cls.term_two_obj)
+        cls.addAttribute(cls.value_true_obj)
+        cls.addAttribute(cls.value_false_obj)
+        cls.addAttribute(cls.result_obj)     
+        cls.addAttribute(cls.value_true_vector_obj)
+        cls.addAttribute(cls.value_false_vector_obj)
+        cls.addAttribute(cls.result_vector_obj)
+        cls.addAttribute(cls.value_true_matrix_obj)
+        cls.addAttribute(cls.value_false_matrix_obj)
+        cls.addAttribute(cls.result_matrix_obj)
         
-        for index in range(10):
-            index_str = str(index)
-            exec(f"cls.check_0{index_str} = numeric_attr.create('check_0{index_str}', 'ch0{index_str}', om.MFnNumericData.k2Double, index)")
-            exec(f'cls.addAttribute(cls.check_0{index_str})')
-            exec(f'cls.attributeAffects(cls.check_0{index_str}, cls.output_obj)')
-            
         # affects
-        cls.attributeAffects(cls.input_obj, cls.output_obj)
-     
-        pass
+        cls.attributeAffects(cls.term_one_obj, cls.result_obj)
+        cls.attributeAffects(cls.term_two_obj, cls.result_obj)
+        cls.attributeAffects(cls.value_true_obj, cls.result_obj)
+        cls.attributeAffects(cls.value_false_obj, cls.result_obj)
+        cls.attributeAffects(cls.operation_obj, cls.result_obj)
+        
+        for result_obj, value_objs in ((cls.result_vector_obj, (cls.value_true_vector_obj, cls.value_false_vector_obj)),
+                                       (cls.result_matrix_obj, (cls.value_true_matrix_obj, cls.value_false_matrix_obj))):
+            for attr_obj in (cls.term_one_obj, cls.term_two_obj, cls.operation_obj) + value_objs:
+                cls.attributeAffects(attr_obj, result_obj)
         
     
+###############################
+### Node:  krConditionArray ###
+###############################
+'''
+Use:    Node Editor.  The array version of krCondition - one node for a whole array of conditions (per vertex, per joint, etc)
+
+Plugs Input:        Operation   - whether Equal to, not equal to, greater than, greater than or equal to, less than, less than or equal to
+
+Plugs Output:       Result      - double array
+
+Node Attributes:    Term one, term two, value if true and value if false are all double arrays, compared element by element.
+                    An array with a single value (or empty, for 0.0) is used for every element.
+                    If the other arrays are different lengths, the result is the length of the shortest.
+'''
+
+class AttrCheckArrayNode(om.MPxNode):
+
+    TYPE_NAME = "krConditionArray"
+    TYPE_ID = om.MTypeId(0x0007F7F9)
+
+    term_one_obj = None
+    term_two_obj = None
+    value_true_obj = None
+    value_false_obj = None
+    operation_obj = None
+    result_obj = None
+
+    def __init__(self):
+        super(AttrCheckArrayNode, self).__init__()
+
+    def schedulingType(self):
+        return om.MPxNode.kParallel
+
+    def compute(self, plug, data):
+
+        # when the node is dirty
+        if plug == AttrCheckArrayNode.result_obj:
+
+            # get the required values
+            inputs = [AttrCheckArrayNode.input_array(data, attr) for attr in (AttrCheckArrayNode.term_one_obj,
+                                                                              AttrCheckArrayNode.term_two_obj,
+                                                                              AttrCheckArrayNode.value_true_obj,
+                                                                              AttrCheckArrayNode.value_false_obj)]
+
+            operation = OPERATIONS[data.inputValue(AttrCheckArrayNode.operation_obj).asInt()]
+
+            # the length of the result - single values are used for every element
+            lengths = [len(values) for values in inputs if len(values) > 1]
+            length = min(lengths) if lengths else 1
+
+            if np is not None:
+                term_one, term_two, value_true, value_false = [AttrCheckArrayNode.broadcast(values, length) for values in inputs]
+                result = np.where(operation(term_one, term_two), value_true, value_false).tolist()
+            else:
+                term_one, term_two, value_true, value_false = inputs
+                element = AttrCheckArrayNode.element
+                result = []
+
+                for index in range(length):
+                    if operation(element(term_one, index), element(term_two, index)):
+                        result.append(element(value_true, index))
+                    else:
+                        result.append(element(value_false, index))
+
+            # set the result value
+            output_data = om.MFnDoubleArrayData().create(om.MDoubleArray(result))
+            data.outputValue(AttrCheckArrayNode.result_obj).setMObject(output_data)
+
+    @staticmethod
+    def input_array(data, attr):
+        # the values of a double array input - an empty array is a single 0.0
+        values = om.MFnDoubleArrayData(data.inputValue(attr).data()).array()
+        if len(values) == 0:
+            return [0.0]
+
+        if np is not None:
+            return np.array(values, dtype=np.float64)
+        return values
+
+    @staticmethod
+    def element(values, index):
+        # a single value is used for every element
+        if len(values) == 1:
+            return values[0]
+        return values[index]
+
+    @staticmethod
+    def broadcast(values, length):
+        # a single value is repeated, anything longer is cut to the length
+        if len(values) == 1:
+            return np.full(length, values[0])
+        return values[:length]
+
+    @classmethod
+    def creator(cls):
+        return AttrCheckArrayNode()
+
+    @classmethod
+    def initialize(cls):
+
+        typed_attr = om.MFnTypedAttribute()
+        enum_attr = om.MFnEnumAttribute()
+        array_data_fn = om.MFnDoubleArrayData()
+
+        # the inputs - all double arrays
+        for attr_name, short_name in (('term_one', 'one'), ('term_two', 'two'), ('value_true', 'true'), ('value_false', 'false')):
+            attr_obj = typed_attr.create(attr_name, short_name, om.MFnData.kDoubleArray, array_data_fn.create(om.MDoubleArray()))
+            typed_attr.keyable = True
+            typed_attr.readable = False
+            setattr(cls, attr_name + '_obj', attr_obj)
+
+        # operation enum
+        cls.operation_obj = enum_attr.create('operation', 'op', 0)
+        enum_attr.keyable = True
+        enum_attr.readable = False
+
+        enum_attr.addField('equal', 0)
+        enum_attr.addField('not equal', 1)
+        enum_attr.addField('greater than', 2)
+        enum_attr.addField('greater then or equal', 3)
+        enum_attr.addField('less than', 4)
+        enum_attr.addField('less than or equal', 5)
+
+        # output node
+        cls.result_obj = typed_attr.create('result', 'res', om.MFnData.kDoubleArray, array_data_fn.create(om.MDoubleArray()))
+        typed_attr.writable = False
+        typed_attr.storable = False
+
+        # add attributes
+        cls.addAttribute(cls.term_one_obj)
+        cls.addAttribute(cls.operation_obj)
+        cls.addAttribute(cls.term_two_obj)
+        cls.addAttribute(cls.value_true_obj)
+        cls.addAttribute(cls.value_false_obj)
+        cls.addAttribute(cls.result_obj)
+
+        # affects
+        cls.attributeAffects(cls.term_one_obj, cls.result_obj)
+        cls.attributeAffects(cls.term_two_obj, cls.result_obj)
+        cls.attributeAffects(cls.value_true_obj, cls.result_obj)
+        cls.attributeAffects(cls.value_false_obj, cls.result_obj)
+        cls.attributeAffects(cls.operation_obj, cls.result_obj)
+
+
+###############################
+### Node:  krConditionChain ###
+###############################
+'''
+Use:    Node Editor.  An if / else if chain of krCondition nodes, as one node
+
+Plugs Input:        Term one
+
+Plugs Output:       Result
+
+Node Attributes:    Cases           - any number of case_term_two / case_operation / case_value, checked in order
+                                      the case_value of the first case where (term_one  case_operation  case_term_two) is true is the result
+                    Default value   - the result if none of the cases are true
+                    
+'''
+
+class AttrCheckChainNode(om.MPxNode):
+
+    TYPE_NAME = "krConditionChain"
+    TYPE_ID = om.MTypeId(0x0007F7FC)
+    
+    term_one_obj = None
+    default_value_obj = None
+    result_obj = None
+    
+    cases_obj = None
+    case_term_two_obj = None
+    case_operation_obj = None
+    case_value_obj = None
+    
+    def __init__(self):
+        super(AttrCheckChainNode, self).__init__()
+    
+    def schedulingType(self):
+        return om.MPxNode.kParallel
+    
+    def compute(self, plug, data):
+        
+        # when the node is dirty
+        if plug == AttrCheckChainNode.result_obj:
+            
+            # get the required values
+            term_one = data.inputValue(AttrCheckChainNode.term_one_obj).asDouble()
+            result = data.inputValue(AttrCheckChainNode.default_value_obj).asDouble()
+            
+            cases_handle = data.inputArrayValue(AttrCheckChainNode.cases_obj)
+            
+            # stops at the first case that is true - the cases after it are not read
+            for index in range(cases_handle.elementCount()):
+                cases_handle.jumpToPhysicalElement(index)
+                case_handle = cases_handle.inputValue()
+                
+                operation = OPERATIONS[case_handle.child(AttrCheckChainNode.case_operation_obj).asShort()]
+                
+                if operation(term_one, case_handle.child(AttrCheckChainNode.case_term_two_obj).asDouble()):
+                    result = case_handle.child(AttrCheckChainNode.case_value_obj).asDouble()
+                    break
+            
+            output_data = data.outputValue(AttrCheckChainNode.result_obj)
+            output_data.setDouble(result)
+    
+    @classmethod
+    def creator(cls):
+        return AttrCheckChainNode()
+        
+    @classmethod
+    def initialize(cls):
+    
+        numeric_attr = om.MFnNumericAttribute()
+        enum_attr = om.MFnEnumAttribute()
+        compound_attr = om.MFnCompoundAttribute()
+        
+        # term one
+        cls.term_one_obj = numeric_attr.create('term_one', 'one', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+        
+        # default value
+        cls.default_value_obj = numeric_attr.create('default_value', 'def', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+        
+        # the cases
+        cls.case_term_two_obj = numeric_attr.create('case_term_two', 'ctwo', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        
+        cls.case_operation_obj = enum_attr.create('case_operation', 'cop', 0)
+        enum_attr.keyable = True
+        
+        enum_attr.addField('equal', 0)
+        enum_attr.addField('not equal', 1)
+        enum_attr.addField('greater than', 2)
+        enum_attr.addField('greater then or equal', 3)
+        enum_attr.addField('less than', 4)
+        enum_attr.addField('less than or equal', 5)
+        
+        cls.case_value_obj = numeric_attr.create('case_value', 'cvl', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        
+        cls.cases_obj = compound_attr.create('cases', 'cas')
+        compound_attr.addChild(cls.case_term_two_obj)
+        compound_attr.addChild(cls.case_operation_obj)
+        compound_attr.addChild(cls.case_value_obj)
+        compound_attr.array = True
+        compound_attr.readable = False
+        
+        # output node
+        cls.result_obj = numeric_attr.create('result', 'res', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.writable = False
+        
+        # add attributes
+        cls.addAttribute(cls.term_one_obj)
+        cls.addAttribute(cls.cases_obj)
+        cls.addAttribute(cls.default_value_obj)
+        cls.addAttribute(cls.result_obj)
+        
+        # affects
+        cls.attributeAffects(cls.term_one_obj, cls.result_obj)
+        cls.attributeAffects(cls.cases_obj, cls.result_obj)
+        cls.attributeAffects(cls.case_term_two_obj, cls.result_obj)
+        cls.attributeAffects(cls.case_operation_obj, cls.result_obj)
+        cls.attributeAffects(cls.case_value_obj, cls.result_obj)
+        cls.attributeAffects(cls.default_value_obj, cls.result_obj)
+
+
+###########################
+### Node:  krExpression ###
+###########################
+'''
+Use:    Node Editor.  Anything more than one krCondition - conditions and maths in one node
+
+Plugs Input:        Inputs      - any number of input_name / input_value / input_array, used by name in the expression
+
+Plugs Output:       Output          - the expression with each input_value
+                    Output array    - the expression element by element, with each input_array - an input with an empty
+                                      array uses its input_value, and an array with a single value is used for every element.
+                                      If the other arrays are different lengths, the result is the length of the shortest
+
+Node Attributes:    Expression  - for example   a > b ? c * 2 : d
+                                  numbers, input names, ( ), + - * / %, == != < <= > >=, && || !, condition ? value : value
+                                  and the functions abs, min, max, clamp, pow, sqrt, exp, log, sin, cos, tan, floor, ceil
+                                  An input name that is not in the inputs is 0.0
+'''
+
+EXPRESSION_TOKEN = re.compile(r'\s*(?:(\d+\.?\d*(?:[eE][-+]?\d+)?|\.\d+(?:[eE][-+]?\d+)?)|([A-Za-z_]\w*)|(&&|\|\||==|!=|<=|>=|[-+*/%<>!?:(),]))')
+
+# the functions the compiled expressions can use - numpy versions work on single values and arrays alike
+if np is not None:
+    EXPRESSION_FUNCTIONS = {'abs': np.abs, 'min': np.minimum, 'max': np.maximum, 'clamp': np.clip, 'pow': np.power,
+                            'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'sin': np.sin, 'cos': np.cos, 'tan': np.tan,
+                            'floor': np.floor, 'ceil': np.ceil}
+    EXPRESSION_HELPERS = {'where': np.where, 'logical_and': np.logical_and, 'logical_or': np.logical_or, 'logical_not': np.logical_not}
+else:
+    EXPRESSION_FUNCTIONS = {'abs': abs, 'min': min, 'max': max, 'clamp': lambda value, low, high: min(max(value, low), high),
+                            'pow': math.pow, 'sqrt': math.sqrt, 'exp': math.exp, 'log': math.log, 'sin': math.sin,
+                            'cos': math.cos, 'tan': math.tan, 'floor': math.floor, 'ceil': math.ceil}
+    EXPRESSION_HELPERS = {}
+
+# how the ternary and logical operators are written - single values only evaluate the side that is used, so  b ? a / b : 0
+# is safe, while arrays evaluate both sides through the numpy helpers
+SCALAR_TEMPLATES = {'?': '({1} if {0} else {2})', '||': '(bool({0}) or bool({1}))', '&&': '(bool({0}) and bool({1}))', '!': '(not {0})'}
+ARRAY_TEMPLATES = {'?': 'where({0}, {1}, {2})', '||': 'logical_or({0}, {1})', '&&': 'logical_and({0}, {1})', '!': 'logical_not({0})'}
+
+
+class ExpressionParser(object):
+    '''
+    parses an expression into python source - one method for each level of precedence, lowest first
+    only the numbers, names and operators it recognises are written into the source, inputs as v_name and functions as f_name
+    '''
+
+    def __init__(self, expression, templates=SCALAR_TEMPLATES):
+        self.templates = templates
+        self.tokens = []
+        self.names = []
+
+        position = 0
+        expression = expression.rstrip()
+
+        while position < len(expression):
+            match = EXPRESSION_TOKEN.match(expression, position)
+            if match is None:
+                raise ValueError('unexpected "{0}"'.format(expression[position:].strip()[:10]))
+
+            number, name, symbol = match.groups()
+            self.tokens.append(('number', number) if number else ('name', name) if name else ('symbol', symbol))
+            position = match.end()
+
+        self.index = 0
+
+    def peek(self):
+        return self.tokens[self.index][1] if self.index < len(self.tokens) else None
+
+    def take(self, expected=None):
+        if self.index >= len(self.tokens):
+            raise ValueError('the expression ends too early')
+
+        kind, token = self.tokens[self.index]
+        if expected is not None and token != expected:
+            raise ValueError('expected "{0}", found "{1}"'.format(expected, token))
+
+        self.index += 1
+        return kind, token
+
+    def parse(self):
+        source = self.ternary()
+        if self.index < len(self.tokens):
+            raise ValueError('unexpected "{0}"'.format(self.peek()))
+
+        return source
+
+    def ternary(self):
+        condition = self.logical_or()
+        if self.peek() != '?':
+            return condition
+
+        self.take('?')
+        if_true = self.ternary()
+        self.take(':')
+        if_false = self.ternary()
+
+        return self.templates['?'].format(condition, if_true, if_false)
+
+    def logical_or(self):
+        source = self.logical_and()
+        while self.peek() == '||':
+            self.take()
+            source = self.templates['||'].format(source, self.logical_and())
+
+        return source
+
+    def logical_and(self):
+        source = self.comparison()
+        while self.peek() == '&&':
+            self.take()
+            source = self.templates['&&'].format(source, self.comparison())
+
+        return source
+
+    def comparison(self):
+        source = self.additive()
+        if self.peek() in ('==', '!=', '<', '<=', '>', '>='):
+            symbol = self.take()[1]
+            source = '({0} {1} {2})'.format(source, symbol, self.additive())
+
+        return source
+
+    def additive(self):
+        source = self.term()
+        while self.peek() in ('+', '-'):
+            symbol = self.take()[1]
+            source = '({0} {1} {2})'.format(source, symbol, self.term())
+
+        return source
+
+    def term(self):
+        source = self.unary()
+        while self.peek() in ('*', '/', '%'):
+            symbol = self.take()[1]
+            source = '({0} {1} {2})'.format(source, symbol, self.unary())
+
+        return source
+
+    def unary(self):
+        if self.peek() in ('-', '+'):
+            symbol = self.take()[1]
+            return '({0}{1})'.format(symbol, self.unary())
+
+        if self.peek() == '!':
+            self.take()
+            return self.templates['!'].format(self.unary())
+
+        return self.primary()
+
+    def primary(self):
+        kind, token = self.take()
+
+        if kind == 'number':
+            return repr(float(token))
+
+        if token == '(':
+            source = self.ternary()
+            self.take(')')
+            return source
+
+        if kind != 'name':
+            raise ValueError('unexpected "{0}"'.format(token))
+
+        # a function call
+        if self.peek() == '(':
+            if token not in EXPRESSION_FUNCTIONS:
+                raise ValueError('unknown function "{0}"'.format(token))
+
+            self.take('(')
+            arguments = [self.ternary()]
+            while self.peek() == ',':
+                self.take()
+                arguments.append(self.ternary())
+            self.take(')')
+
+            return 'f_{0}({1})'.format(token, ', '.join(arguments))
+
+        # an input
+        if token not in self.names:
+            self.names.append(token)
+
+        return 'v_' + token
+
+
+def compile_expression(expression, templates=SCALAR_TEMPLATES):
+    '''
+    compiles an expression into a function of its inputs - returns the function and the input names, in the order it takes them
+    '''
+    parser = ExpressionParser(expression, templates)
+    source = parser.parse()
+
+    # a literal past the float range is written into the source as inf
+    namespace = dict(EXPRESSION_HELPERS, nan=float('nan'), inf=float('inf'))
+    namespace.update(('f_' + name, function) for name, function in EXPRESSION_FUNCTIONS.items())
+
+    code = 'def expression({0}):\n    return {1}'.format(', '.join('v_' + name for name in parser.names), source)
+    exec(compile(code, '<krExpression>', 'exec'), namespace)
+
+    return namespace['expression'], tuple(parser.names)
+
+
+class ExpressionNode(om.MPxNode):
+
+    TYPE_NAME = "krExpression"
+    TYPE_ID = om.MTypeId(0x0007F7FE)
+
+    expression_obj = None
+    inputs_obj = None
+    input_name_obj = None
+    input_value_obj = None
+    input_array_obj = None
+    output_obj = None
+    output_array_obj = None
+
+    def __init__(self):
+        super(ExpressionNode, self).__init__()
+
+        # the compiled expression for single values and for numpy arrays, and its input names - None when it needs to be compiled again
+        self.program = None
+        self.array_program = None
+        self.names = ()
+
+        # a failing expression is only reported once, until it is compiled again
+        self.reported = False
+
+    def schedulingType(self):
+        return om.MPxNode.kParallel
+
+    def setDependentsDirty(self, plug, plug_array):
+        # the expression has changed - it is compiled again in the next compute
+        if plug.attribute() == ExpressionNode.expression_obj:
+            self.program = None
+
+        return super(ExpressionNode, self).setDependentsDirty(plug, plug_array)
+
+    def preEvaluation(self, context, evaluation_node):
+        # the evaluation manager does not call setDependentsDirty, so the expression is checked here as well
+        if evaluation_node.dirtyPlugExists(ExpressionNode.expression_obj):
+            self.program = None
+
+    def report(self, message):
+        # compute may be running on a worker thread, so the warning is shown from the main thread
+        if not self.reported:
+            maya.utils.executeDeferred(om.MGlobal.displayWarning, '{0}: {1}'.format(self.name(), message))
+            self.reported = True
+
+    def build_program(self, data):
+        self.reported = False
+        self.program = self.array_program = lambda: 0.0
+        self.names = ()
+
+        # an empty expression is 0.0
+        expression = data.inputValue(ExpressionNode.expression_obj).asString()
+        if not expression.strip():
+            return
+
+        try:
+            self.program, self.names = compile_expression(expression)
+
+            # without numpy, arrays are done an element at a time with the single value version
+            if np is not None:
+                self.array_program = compile_expression(expression, ARRAY_TEMPLATES)[0]
+            else:
+                self.array_program = self.program
+
+        except (ValueError, SyntaxError) as error:
+            self.report('could not compile the expression - {0}'.format(error))
+
+    def read_inputs(self, data):
+        # the value and array of each input by name - the first input with a name wins
+        values = {}
+        arrays = {}
+
+        inputs_handle = data.inputArrayValue(ExpressionNode.inputs_obj)
+
+        for index in range(inputs_handle.elementCount()):
+            inputs_handle.jumpToPhysicalElement(index)
+            input_handle = inputs_handle.inputValue()
+
+            name = input_handle.child(ExpressionNode.input_name_obj).asString()
+            if name in values:
+                continue
+
+            values[name] = input_handle.child(ExpressionNode.input_value_obj).asDouble()
+            arrays[name] = om.MFnDoubleArrayData(input_handle.child(ExpressionNode.input_array_obj).data()).array()
+
+        return values, arrays
+
+    def compute(self, plug, data):
+
+        # when the node is dirty
+        if plug == ExpressionNode.output_obj or plug == ExpressionNode.output_array_obj:
+
+            if self.program is None:
+                self.build_program(data)
+
+            values, arrays = self.read_inputs(data)
+
+            try:
+                if plug == ExpressionNode.output_obj:
+                    result = float(self.program(*[values.get(name, 0.0) for name in self.names]))
+                else:
+                    result = self.evaluate_arrays(values, arrays)
+
+            except (ArithmeticError, ValueError, TypeError) as error:
+                self.report('could not evaluate the expression - {0}'.format(error))
+                result = 0.0 if plug == ExpressionNode.output_obj else []
+
+            # set the outputs
+            if plug == ExpressionNode.output_obj:
+                data.outputValue(ExpressionNode.output_obj).setDouble(result)
+            else:
+                output_data = om.MFnDoubleArrayData().create(om.MDoubleArray(result))
+                data.outputValue(ExpressionNode.output_array_obj).setMObject(output_data)
+
+    def evaluate_arrays(self, values, arrays):
+        # the inputs of the expression - an array, or the value if the array is empty
+        inputs = [arrays[name] if name in arrays and len(arrays[name]) else [values.get(name, 0.0)] for name in self.names]
+
+        # the length of the result - single values are used for every element
+        lengths = [len(input_values) for input_values in inputs if len(input_values) > 1]
+        length = min(lengths) if lengths else 1
+
+        if np is not None:
+            arguments = [input_values[0] if len(input_values) == 1 else np.array(input_values[:length], dtype=np.float64)
+                         for input_values in inputs]
+
+            # division by zero is inf or nan, the same as numpy
+            with np.errstate(all='ignore'):
+                result = self.array_program(*arguments)
+
+            return np.broadcast_to(np.asarray(result, dtype=np.float64), (length,)).tolist()
+
+        element = AttrCheckArrayNode.element
+        return [float(self.program(*[element(input_values, index) for input_values in inputs])) for index in range(length)]
+
+    @classmethod
+    def creator(cls):
+        return ExpressionNode()
+
+    @classmethod
+    def initialize(cls):
+
+        text_attr = om.MFnTypedAttribute()
+        numeric_attr = om.MFnNumericAttribute()
+        compound_attr = om.MFnCompoundAttribute()
+        array_data_fn = om.MFnDoubleArrayData()
+
+        cls.expression_obj = text_attr.create('expression', 'exp', om.MFnData.kString)
+        text_attr.readable = False
+
+        # the inputs
+        cls.input_name_obj = text_attr.create('input_name', 'inam', om.MFnData.kString)
+
+        cls.input_value_obj = numeric_attr.create('input_value', 'ival', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+
+        cls.input_array_obj = text_attr.create('input_array', 'iarr', om.MFnData.kDoubleArray, array_data_fn.create(om.MDoubleArray()))
+
+        cls.inputs_obj = compound_attr.create('inputs', 'in')
+        compound_attr.addChild(cls.input_name_obj)
+        compound_attr.addChild(cls.input_value_obj)
+        compound_attr.addChild(cls.input_array_obj)
+        compound_attr.array = True
+        compound_attr.readable = False
+
+        # output nodes
+        cls.output_obj = numeric_attr.create('output', 'out', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.writable = False
+
+        cls.output_array_obj = text_attr.create('output_array', 'oarr', om.MFnData.kDoubleArray, array_data_fn.create(om.MDoubleArray()))
+        text_attr.writable = False
+        text_attr.storable = False
+
+        # add attributes
+        cls.addAttribute(cls.expression_obj)
+        cls.addAttribute(cls.inputs_obj)
+        cls.addAttribute(cls.output_obj)
+        cls.addAttribute(cls.output_array_obj)
+
+        # affects
+        for output_obj in (cls.output_obj, cls.output_array_obj):
+            for attr_obj in (cls.expression_obj, cls.inputs_obj, cls.input_name_obj, cls.input_value_obj, cls.input_array_obj):
+                cls.attributeAffects(attr_obj, output_obj)
+
+
+##########################################
+### Basic Node:  krMultiEqualCondition ###
+##########################################
+'''
+Use:    Node Editor
+
+Plugs Input:        Input
+
+Plugs Output:       Output
+
+Node Attributes:    Check 00 to Check 09
+                    First:  the number to check
+                    Second: the output if a match
+                    
+                    Entries:    any number of entry_key / entry_value pairs, looked up if none of the checks match
+                    
+                    Match Mode: exact       the input must equal the check or entry key
+                                tolerance   the input must be within tolerance of the check or entry key
+                                range       the checks and entries are not used - the input is looked up in the bands
+                    
+                    Tolerance:  the distance allowed in tolerance mode
+                    
+                    Bands:      any number of band_min / band_max / band_value, matched when band_min <= input < band_max
+                                where bands overlap, the one with the highest band_min wins
+                    
+                    Table File: a .csv or .npy table, looked up last - read when table_file is set, so set it again to pick up
+                                a saved file (the file is only read again if it has changed)
+                                two columns are key / value, used with the entries in exact and tolerance mode
+                                three columns are min / max / value, used with the bands in range mode
+                    
+'''
+
+# the match_mode enum values
+MATCH_EXACT = 0
+MATCH_TOLERANCE = 1
+MATCH_RANGE = 2
+
+
+class EntryIndex(object):
+    '''
+    the key / value entries - a dictionary for exact lookups, and the keys sorted for bisect lookups within a tolerance
+    the first entry for each key wins, the same as the checks
+    '''
+    
+    COLUMNS = 2
+    
+    def __init__(self, keys, values):
+        self.table = {}
+        for key, value in zip(keys, values):
+            self.table.setdefault(key, value)
+        
+        # the entry order is kept with the sorted keys, so the first entry in tolerance still wins
+        self.order = sorted(range(len(keys)), key=keys.__getitem__)
+        self.keys = [keys[index] for index in self.order]
+        self.values = [values[index] for index in self.order]
+    
+    def find(self, key, default):
+        return self.table.get(key, default)
+    
+    def find_near(self, key, tolerance, default):
+        best = None
+        
+        # only the keys in [key - tolerance, key + tolerance] are looked at
+        for index in range(bisect_left(self.keys, key - tolerance), len(self.keys)):
+            if self.keys[index] > key + tolerance:
+                break
+            
+            if best is None or self.order[index] < self.order[best]:
+                best = index
+        
+        return default if best is None else self.values[best]
+
+
+class BandIndex(object):
+    '''
+    the min / max / value bands, sorted by min for bisect lookups
+    '''
+    
+    COLUMNS = 3
+    
+    def __init__(self, mins, maxs, values):
+        order = sorted(range(len(mins)), key=mins.__getitem__)
+        self.mins = [mins[index] for index in order]
+        self.maxs = [maxs[index] for index in order]
+        self.values = [values[index] for index in order]
+        
+        # the highest max up to each band - the search back through overlapping bands stops when nothing before can reach the value
+        self.reach = []
+        for band_max in self.maxs:
+            self.reach.append(max(band_max, self.reach[-1]) if self.reach else band_max)
+    
+    def find(self, key, default):
+        # the last band starting at or before the key - for bands that do not overlap, this is the only one checked
+        index = bisect_right(self.mins, key) - 1
+        
+        while index >= 0 and self.reach[index] > key:
+            if self.maxs[index] > key:
+                return self.values[index]
+            index -= 1
+        
+        return default
+
+
+class ArrayEntryIndex(object):
+    '''
+    the key / value columns of a table file, searched with numpy
+    when the file is already sorted by key, the columns stay views of the memory mapped file
+    '''
+    
+    COLUMNS = 2
+    
+    def __init__(self, keys, values):
+        # the file order, for the first entry in tolerance to win - None when the keys are already sorted
+        self.order = None
+        
+        if len(keys) > 1 and not (keys[:-1] <= keys[1:]).all():
+            self.order = np.argsort(keys, kind='stable')
+            keys = keys[self.order]
+            values = values[self.order]
+        
+        self.keys = keys
+        self.values = values
+    
+    def find(self, key, default):
+        index = self.keys.searchsorted(key)
+        
+        if index < len(self.keys) and self.keys[index] == key:
+            return float(self.values[index])
+        
+        return default
+    
+    def find_near(self, key, tolerance, default):
+        start = self.keys.searchsorted(key - tolerance, 'left')
+        end = self.keys.searchsorted(key + tolerance, 'right')
+        
+        if start == end:
+            return default
+        
+        if self.order is not None:
+            start += int(self.order[start:end].argmin())
+        
+        return float(self.values[start])
+
+
+class ArrayBandIndex(object):
+    '''
+    the min / max / value columns of a table file, searched with numpy - the same search as BandIndex
+    '''
+    
+    COLUMNS = 3
+    
+    def __init__(self, mins, maxs, values):
+        if len(mins) > 1 and not (mins[:-1] <= mins[1:]).all():
+            order = np.argsort(mins, kind='stable')
+            mins = mins[order]
+            maxs = maxs[order]
+            values = values[order]
+        
+        self.mins = mins
+        self.maxs = maxs
+        self.values = values
+        self.reach = np.maximum.accumulate(maxs)
+    
+    def find(self, key, default):
+        index = int(self.mins.searchsorted(key, 'right')) - 1
+        
+        while index >= 0 and self.reach[index] > key:
+            if self.maxs[index] > key:
+                return float(self.values[index])
+            index -= 1
+        
+        return default
+
+
+# the loaded table files, shared by every node - absolute path: (mtime, index).  Nodes evaluated in parallel load
+# their files from worker threads, so the cache is only used with the lock held
+TABLE_FILES = {}
+TABLE_FILES_LOCK = threading.Lock()
+
+
+def read_table_file(path):
+    '''
+    reads a .npy or .csv table file into an index - two columns for entries, three for bands
+    '''
+    if path.lower().endswith('.npy'):
+        if np is None:
+            raise ValueError('numpy is not available to read .npy files')
+        
+        # memory mapped and read only, so it is only paged in as it is searched
+        rows = np.load(path, mmap_mode='r')
+        
+        if rows.ndim != 2 or rows.shape[1] not in (2, 3):
+            raise ValueError('expected 2 or 3 columns, found shape {0}'.format(rows.shape))
+        
+        columns = [rows[:, column] for column in range(rows.shape[1])]
+        
+        return (ArrayEntryIndex if len(columns) == 2 else ArrayBandIndex)(*columns)
+    
+    rows = []
+    with open(path, newline='') as table_file:
+        for row in csv.reader(table_file):
+            try:
+                rows.append([float(cell) for cell in row if cell.strip()])
+            
+            # headers and notes are skipped
+            except ValueError:
+                pass
+    
+    rows = [row for row in rows if row]
+    
+    if not rows or len(rows[0]) not in (2, 3) or any(len(row) != len(rows[0]) for row in rows):
+        raise ValueError('expected rows of 2 or 3 numbers')
+    
+    columns = [list(column) for column in zip(*rows)]
+    
+    if np is not None:
+        return (ArrayEntryIndex if len(columns) == 2 else ArrayBandIndex)(*[np.array(column) for column in columns])
+    
+    return (EntryIndex if len(columns) == 2 else BandIndex)(*columns)
+
+
+def load_table_file(path):
+    '''
+    the index for a table file, read again only when the file's mtime changes - None if it can not be read
+    '''
+    path = os.path.abspath(os.path.expandvars(path))
+    
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    
+    # the file is read with the lock held, so nodes using the same file wait for the one read
+    with TABLE_FILES_LOCK:
+        cached = TABLE_FILES.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        
+        # a file that fails is kept as None, so the warning is only shown once per save.  This may be a worker thread,
+        # so the warning is shown from the main thread
+        try:
+            table = read_table_file(path)
+        except (OSError, ValueError) as error:
+            maya.utils.executeDeferred(om.MGlobal.displayWarning, 'krMultiEqualCondition: could not read table file {0} - {1}'.format(path, error))
+            table = None
+        
+        TABLE_FILES[path] = (mtime, table)
+    
+    return table
+
+
+class ConvertInputNode(om.MPxNode):
+
+    TYPE_NAME = "krMultiEqualCondition"
+    TYPE_ID = om.MTypeId(0x0007F7F7)
+    
+    input_obj = None
+    output_obj = None
+    
+    # the check_00 to check_09 attributes, in order - set in initialize
+    check_objs = ()
+    
+    entries_obj = None
+    entry_key_obj = None
+    entry_value_obj = None
+    
+    match_mode_obj = None
+    tolerance_obj = None
+    
+    bands_obj = None
+    band_min_obj = None
+    band_max_obj = None
+    band_value_obj = None
+    
+    table_file_obj = None
+    
+    def __init__(self):
+        super(ConvertInputNode, self).__init__()
+        
+        # the entries and bands, indexed - None when they need to be built again
+        self.table = None
+        self.bands = None
+        
+        # the index of the table file (None without one), and whether table_file has changed since it was loaded
+        self.file_table = None
+        self.file_table_dirty = True
+    
+    def schedulingType(self):
+        # the indexed entries, bands and table file are cached on the node itself (self.table, self.bands and self.file_table).
+        # A node is only computed by one thread at a time, each cache is only thrown away from setDependentsDirty / preEvaluation
+        # when its attributes change, and the table files shared between nodes are behind a lock - safe for parallel evaluation
+        # and cached playback
+        return om.MPxNode.kParallel
+    
+    def setDependentsDirty(self, plug, plug_array):
+        # an entry or band has changed - it is indexed again in the next compute
+        attr = plug.attribute()
+        
+        if attr in (ConvertInputNode.entries_obj, ConvertInputNode.entry_key_obj, ConvertInputNode.entry_value_obj):
+            self.table = None
+        
+        elif attr in (ConvertInputNode.bands_obj, ConvertInputNode.band_min_obj, ConvertInputNode.band_max_obj, ConvertInputNode.band_value_obj):
+            self.bands = None
+        
+        elif attr == ConvertInputNode.table_file_obj:
+            self.file_table_dirty = True
+        
+        return super(ConvertInputNode, self).setDependentsDirty(plug, plug_array)
+    
+    def preEvaluation(self, context, evaluation_node):
+        # the evaluation manager does not call setDependentsDirty, so the dirty entries and bands are checked here as well
+        for attr in (ConvertInputNode.entries_obj, ConvertInputNode.entry_key_obj, ConvertInputNode.entry_value_obj):
+            if evaluation_node.dirtyPlugExists(attr):
+                self.table = None
+                break
+        
+        for attr in (ConvertInputNode.bands_obj, ConvertInputNode.band_min_obj, ConvertInputNode.band_max_obj, ConvertInputNode.band_value_obj):
+            if evaluation_node.dirtyPlugExists(attr):
+                self.bands = None
+                break
+        
+        if evaluation_node.dirtyPlugExists(ConvertInputNode.table_file_obj):
+            self.file_table_dirty = True
+    
+    @staticmethod
+    def read_elements(data, array_obj, child_objs):
+        # the values of each child, as lists in the order of the elements
+        columns = tuple([] for child_obj in child_objs)
+        
+        array_handle = data.inputArrayValue(array_obj)
+        
+        for index in range(array_handle.elementCount()):
+            array_handle.jumpToPhysicalElement(index)
+            element_handle = array_handle.inputValue()
+            
+            for column, child_obj in zip(columns, child_objs):
+                column.append(element_handle.child(child_obj).asDouble())
+        
+        return columns
+    
+    def build_table(self, data):
+        return EntryIndex(*self.read_elements(data, ConvertInputNode.entries_obj, (ConvertInputNode.entry_key_obj, ConvertInputNode.entry_value_obj)))
+    
+    def build_bands(self, data):
+        return BandIndex(*self.read_elements(data, ConvertInputNode.bands_obj, (ConvertInputNode.band_min_obj, ConvertInputNode.band_max_obj, ConvertInputNode.band_value_obj)))
+    
+    @staticmethod
+    def lookup(index, key, match_mode, tolerance):
+        # None if there is no match
+        if match_mode == MATCH_TOLERANCE:
+            return index.find_near(key, tolerance, None)
+        
+        return index.find(key, None)
+    
+    def compute(self, plug, data):
+        # when the node is dirty
+        if plug == ConvertInputNode.output_obj:
+            
+            # the output var - None until there is a match
+            my_output = None
+            
+            # get the input variable
+            my_input = data.inputValue(ConvertInputNode.input_obj).asDouble()
+            
+            match_mode = data.inputValue(ConvertInputNode.match_mode_obj).asShort()
+            tolerance = data.inputValue(ConvertInputNode.tolerance_obj).asDouble()
+            
+            # the bands are used on their own
+            if match_mode == MATCH_RANGE:
+                if self.bands is None:
+                    self.bands = self.build_bands(data)
+                
+                my_output = self.bands.find(my_input, None)
+            
+            else:
+                # stops at the first match, incase of duplicates
+                for check_obj in ConvertInputNode.check_objs:
+                    # get the data
+                    my_check, my_result = data.inputValue(check_obj).asDouble2()
+                    
+                    # check the data
+                    if my_input == my_check or (match_mode == MATCH_TOLERANCE and abs(my_input - my_check) <= tolerance):
+                        my_output = my_result
+                        break
+                
+                # if none of the checks match, look the input up in the entries
+                else:
+                    if self.table is None:
+                        self.table = self.build_table(data)
+                    
+                    my_output = self.lookup(self.table, my_input, match_mode, tolerance)
+            
+            # then the table file, if it has the columns for the match mode
+            if my_output is None:
+                # the file is only found and checked when table_file has changed, not every compute
+                if self.file_table_dirty:
+                    table_file = data.inputValue(ConvertInputNode.table_file_obj).asString()
+                    self.file_table = load_table_file(table_file) if table_file else None
+                    self.file_table_dirty = False
+                
+                file_table = self.file_table
+                if file_table is not None and file_table.COLUMNS == (3 if match_mode == MATCH_RANGE else 2):
+                    my_output = self.lookup(file_table, my_input, match_mode, tolerance)
+            
+            # if no match, 0.0 will be the output
+            if my_output is None:
+                my_output = 0.0
+            
+            # set the outputs        
+            output_data_handle = data.outputValue(ConvertInputNode.output_obj)
+            output_data_handle.setDouble(my_output)
+        
+    @classmethod
+    def creator(cls):
+        return ConvertInputNode()
+        
+    @classmethod
+    def initialize(cls):
+    
+        numeric_attr = om.MFnNumericAttribute()
+        
+        # input node
+        cls.input_obj = numeric_attr.create('input', 'inp', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+        
+        # output node
+        cls.output_obj = numeric_attr.create('output', 'out', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.writable = False
+        
+        # add attributes
+        cls.addAttribute(cls.input_obj)
+        cls.addAttribute(cls.output_obj)        
+        
+        check_objs = []
+        for index in range(10):
+            check_obj = numeric_attr.create(f'check_0{index}', f'ch0{index}', om.MFnNumericData.k2Double, index)
+            cls.addAttribute(check_obj)
+            cls.attributeAffects(check_obj, cls.output_obj)
+            
+            # kept by name as well, as check_00 etc
+            setattr(cls, f'check_0{index}', check_obj)
+            check_objs.append(check_obj)
+        
+        cls.check_objs = tuple(check_objs)
+        
+        # the entries - any number of key / value pairs, checked after check_00 to check_09
+        compound_attr = om.MFnCompoundAttribute()
+        
+        cls.entry_key_obj = numeric_attr.create('entry_key', 'ekey', om.MFnNumericData.kDouble, 0.0)
+        cls.entry_value_obj = numeric_attr.create('entry_value', 'evl', om.MFnNumericData.kDouble, 0.0)
+        
+        cls.entries_obj = compound_attr.create('entries', 'ent')
+        compound_attr.addChild(cls.entry_key_obj)
+        compound_attr.addChild(cls.entry_value_obj)
+        compound_attr.array = True
+        
+        cls.addAttribute(cls.entries_obj)
+        cls.attributeAffects(cls.entries_obj, cls.output_obj)
+        cls.attributeAffects(cls.entry_key_obj, cls.output_obj)
+        cls.attributeAffects(cls.entry_value_obj, cls.output_obj)
+        
+        # how the input is matched
+        enum_attr = om.MFnEnumAttribute()
+        
+        cls.match_mode_obj = enum_attr.create('match_mode', 'mmd', MATCH_EXACT)
+        enum_attr.keyable = True
+        enum_attr.readable = False
+        
+        enum_attr.addField('exact', MATCH_EXACT)
+        enum_attr.addField('tolerance', MATCH_TOLERANCE)
+        enum_attr.addField('range', MATCH_RANGE)
+        
+        cls.tolerance_obj = numeric_attr.create('tolerance', 'tol', om.MFnNumericData.kDouble, 0.001)
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+        numeric_attr.setMin(0.0)
+        
+        cls.addAttribute(cls.match_mode_obj)
+        cls.addAttribute(cls.tolerance_obj)
+        cls.attributeAffects(cls.match_mode_obj, cls.output_obj)
+        cls.attributeAffects(cls.tolerance_obj, cls.output_obj)
+        
+        # the bands - any number of min / max / value, used in range mode
+        cls.band_min_obj = numeric_attr.create('band_min', 'bmin', om.MFnNumericData.kDouble, 0.0)
+        cls.band_max_obj = numeric_attr.create('band_max', 'bmax', om.MFnNumericData.kDouble, 0.0)
+        cls.band_value_obj = numeric_attr.create('band_value', 'bvl', om.MFnNumericData.kDouble, 0.0)
+        
+        cls.bands_obj = compound_attr.create('bands', 'bnd')
+        compound_attr.addChild(cls.band_min_obj)
+        compound_attr.addChild(cls.band_max_obj)
+        compound_attr.addChild(cls.band_value_obj)
+        compound_attr.array = True
+        
+        cls.addAttribute(cls.bands_obj)
+        cls.attributeAffects(cls.bands_obj, cls.output_obj)
+        cls.attributeAffects(cls.band_min_obj, cls.output_obj)
+        cls.attributeAffects(cls.band_max_obj, cls.output_obj)
+        cls.attributeAffects(cls.band_value_obj, cls.output_obj)
+        
+        # the table file - checked after the checks, entries and bands
+        text_attr = om.MFnTypedAttribute()
+        
+        cls.table_file_obj = text_attr.create('table_file', 'tfl', om.MFnData.kString)
+        text_attr.usedAsFilename = True
+        text_attr.readable = False
+        
+        cls.addAttribute(cls.table_file_obj)
+        cls.attributeAffects(cls.table_file_obj, cls.output_obj)
+            
+        # affects
+        cls.attributeAffects(cls.input_obj, cls.output_obj)
+     
+        pass
+        
+    
+###############################
+### Node:  krConditionFused ###
+###############################
+'''
+Use:    Created by krConditionNetwork - a network of krCondition and krMultiEqualCondition nodes, evaluated in one compute
+
+Plugs Input:        Inputs      - double[], the connections that went into the network
+
+Plugs Output:       Outputs     - double[], the connections that came out of the network
+
+Node Attributes:    Network     - the fused nodes as a json string, their values and how they were connected
+                                  {'nodes': [{'name', 'type', 'values'}], 'connections': [[source node, attr, destination node, attr]],
+                                   'inputs': [[[node, attr], ...]], 'outputs': [[node, attr]]}
+                                  used to compile the network, and by krConditionNetwork -restore to create the nodes again
+'''
+
+# the python operator for each of the operation enum values
+OPERATION_SYMBOLS = ('==', '!=', '>', '>=', '<', '<=')
+
+# the attributes of each node type that can be fused, kept to restore the nodes - (name, kind)
+FUSED_NODE_ATTRIBUTES = {
+    'krCondition': (('term_one', 'double'), ('term_two', 'double'), ('value_true', 'double'), ('value_false', 'double'),
+                    ('operation', 'short'),
+                    ('value_true_vector', 'compound'), ('value_false_vector', 'compound'),
+                    ('value_true_matrix', 'matrix'), ('value_false_matrix', 'matrix')),
+    'krMultiEqualCondition': (('input', 'double'),) +
+                             tuple((f'check_0{index}', 'compound') for index in range(10)) +
+                             (('match_mode', 'short'), ('tolerance', 'double'), ('entries', 'multi'), ('bands', 'multi')),
+}
+
+# the attributes that can be connected on each node type that can be fused - (inputs, output)
+FUSED_NODE_PLUGS = {
+    'krCondition': (('term_one', 'term_two', 'value_true', 'value_false'), 'result'),
+    'krMultiEqualCondition': (('input',), 'output'),
+}
+
+
+def read_plug_value(plug, kind):
+    # the value of a plug, as something json can store
+    if kind == 'double':
+        return plug.asDouble()
+
+    if kind == 'short':
+        return plug.asShort()
+
+    if kind == 'compound':
+        return [plug.child(index).asDouble() for index in range(plug.numChildren())]
+
+    if kind == 'matrix':
+        matrix = om.MFnMatrixData(plug.asMObject()).matrix()
+        return [matrix[index] for index in range(16)]
+
+    # multi compounds - [logical index, [child values]] for each element
+    return [[logical_index, read_plug_value(plug.elementByLogicalIndex(logical_index), 'compound')]
+            for logical_index in plug.getExistingArrayAttributeIndices()]
+
+
+def write_plug_value(modifier, plug, kind, value):
+    # the opposite of read_plug_value, added to the modifier
+    if kind == 'double':
+        modifier.newPlugValueDouble(plug, value)
+
+    elif kind == 'short':
+        modifier.newPlugValueShort(plug, value)
+
+    elif kind == 'compound':
+        for index, child_value in enumerate(value):
+            modifier.newPlugValueDouble(plug.child(index), child_value)
+
+    elif kind == 'matrix':
+        modifier.newPlugValue(plug, om.MFnMatrixData().create(om.MMatrix(value)))
+
+    else:
+        for logical_index, child_values in value:
+            write_plug_value(modifier, plug.elementByLogicalIndex(logical_index), 'compound', child_values)
+
+
+def compile_network(network):
+    '''
+    compiles a network into a function of the input values, returning the output values
+    each node becomes one line of python, in the order they depend on each other - only numbers and indices from the network
+    are written into the source
+    '''
+    nodes = network['nodes']
+
+    # where each connected input of a node gets its value from
+    sources = {}
+    depends = [set() for node in nodes]
+
+    for source_index, source_attr, node_index, attr in network['connections']:
+        sources[(node_index, attr)] = 's{0}'.format(int(source_index))
+        depends[node_index].add(source_index)
+
+    for input_index, input_plugs in enumerate(network['inputs']):
+        for node_index, attr in input_plugs:
+            sources[(node_index, attr)] = 'x[{0}]'.format(input_index)
+
+    def argument(node_index, attr):
+        # the source of a connected input, otherwise the value that was set on it
+        if (node_index, attr) in sources:
+            return sources[(node_index, attr)]
+        return repr(float(nodes[node_index]['values'][attr]))
+
+    # the nodes, sources before the nodes they are connected to
+    order = []
+    remaining = list(range(len(nodes)))
+
+    while remaining:
+        ready = [node_index for node_index in remaining if depends[node_index].issubset(order)]
+        if not ready:
+            raise ValueError('the network has a cycle')
+
+        order.extend(ready)
+        remaining = [node_index for node_index in remaining if node_index not in ready]
+
+    lines = ['def network(x):']
+    tables = {}
+
+    for node_index in order:
+        node = nodes[node_index]
+
+        if node['type'] == 'krCondition':
+            lines.append('    s{0} = {1} if {2} {3} {4} else {5}'.format(node_index,
+                                                                     argument(node_index, 'value_true'),
+                                                                     argument(node_index, 'term_one'),
+                                                                     OPERATION_SYMBOLS[int(node['values']['operation'])],
+                                                                     argument(node_index, 'term_two'),
+                                                                     argument(node_index, 'value_false')))
+        else:
+            # the checks then the entries - the first for each key wins, the same as the node
+            table = {}
+            for index in range(10):
+                key, value = node['values'][f'check_0{index}']
+                table.setdefault(key, value)
+
+            for logical_index, (key, value) in node['values']['entries']:
+                table.setdefault(key, value)
+
+            tables['t{0}'.format(node_index)] = table
+            lines.append('    s{0} = t{0}.get({1}, 0.0)'.format(node_index, argument(node_index, 'input')))
+
+    lines.append('    return ({0})'.format(''.join('s{0}, '.format(int(node_index)) for node_index, attr in network['outputs'])))
+
+    namespace = dict(tables, nan=float('nan'), inf=float('inf'))
+    exec(compile('\n'.join(lines), '<krConditionFused>', 'exec'), namespace)
+
+    return namespace['network']
+
+
+class FusedConditionNode(om.MPxNode):
+
+    TYPE_NAME = "krConditionFused"
+    TYPE_ID = om.MTypeId(0x0007F7FD)
+
+    network_obj = None
+    inputs_obj = None
+    outputs_obj = None
+
+    def __init__(self):
+        super(FusedConditionNode, self).__init__()
+
+        # the compiled network and the number of inputs it reads - None when it needs to be compiled again
+        self.program = None
+        self.input_count = 0
+
+        # a network that fails is only reported once, until the network text changes
+        self.network_text = None
+        self.reported = False
+
+    def schedulingType(self):
+        return om.MPxNode.kParallel
+
+    def setDependentsDirty(self, plug, plug_array):
+        # the network has changed - it is compiled again in the next compute
+        if plug.attribute() == FusedConditionNode.network_obj:
+            self.program = None
+
+        return super(FusedConditionNode, self).setDependentsDirty(plug, plug_array)
+
+    def preEvaluation(self, context, evaluation_node):
+        # the evaluation manager does not call setDependentsDirty, so the network is checked here as well
+        if evaluation_node.dirtyPlugExists(FusedConditionNode.network_obj):
+            self.program = None
+
+    def report(self, message):
+        # compute may be running on a worker thread, so the warning is shown from the main thread
+        if not self.reported:
+            maya.utils.executeDeferred(om.MGlobal.displayWarning, '{0}: {1}'.format(self.name(), message))
+            self.reported = True
+
+    def build_program(self, data):
+        network_text = data.inputValue(FusedConditionNode.network_obj).asString()
+
+        if network_text != self.network_text:
+            self.network_text = network_text
+            self.reported = False
+
+        if not network_text:
+            return (lambda values: ()), 0
+
+        try:
+            network = json.loads(network_text)
+            return compile_network(network), len(network['inputs'])
+        except (ValueError, KeyError, IndexError, TypeError) as error:
+            self.report('could not compile the network - {0}'.format(error))
+            return (lambda values: ()), 0
+
+    def compute(self, plug, data):
+
+        # when the node is dirty - the output elements are all computed together
+        if plug == FusedConditionNode.outputs_obj or (plug.isElement and plug.array() == FusedConditionNode.outputs_obj):
+
+            if self.program is None:
+                self.program, self.input_count = self.build_program(data)
+
+            # get the input values by logical index - anything not set is 0.0
+            values = [0.0] * self.input_count
+            inputs_handle = data.inputArrayValue(FusedConditionNode.inputs_obj)
+
+            for index in range(inputs_handle.elementCount()):
+                inputs_handle.jumpToPhysicalElement(index)
+                logical_index = inputs_handle.elementLogicalIndex()
+
+                if logical_index < self.input_count:
+                    values[logical_index] = inputs_handle.inputValue().asDouble()
+
+            # set the outputs
+            outputs_handle = data.outputArrayValue(FusedConditionNode.outputs_obj)
+            builder = outputs_handle.builder()
+
+            for index, result in enumerate(self.program(values)):
+                builder.addElement(index).setDouble(result)
+
+            outputs_handle.set(builder)
+            outputs_handle.setAllClean()
+
+    @classmethod
+    def creator(cls):
+        return FusedConditionNode()
+
+    @classmethod
+    def initialize(cls):
+
+        text_attr = om.MFnTypedAttribute()
+        numeric_attr = om.MFnNumericAttribute()
+
+        cls.network_obj = text_attr.create('network', 'net', om.MFnData.kString)
+        text_attr.readable = False
+
+        cls.inputs_obj = numeric_attr.create('inputs', 'in', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.array = True
+        numeric_attr.keyable = True
+        numeric_attr.readable = False
+
+        cls.outputs_obj = numeric_attr.create('outputs', 'out', om.MFnNumericData.kDouble, 0.0)
+        numeric_attr.array = True
+        numeric_attr.usesArrayDataBuilder = True
+        numeric_attr.writable = False
+        numeric_attr.storable = False
+
+        # add attributes
+        cls.addAttribute(cls.network_obj)
+        cls.addAttribute(cls.inputs_obj)
+        cls.addAttribute(cls.outputs_obj)
+
+        # affects
+        cls.attributeAffects(cls.network_obj, cls.outputs_obj)
+        cls.attributeAffects(cls.inputs_obj, cls.outputs_obj)
+
+
+###################################
+### Command: krConditionNetwork ###
+###################################
+'''
+Purpose:    Replace connected krCondition and krMultiEqualCondition nodes with a single krConditionFused node, and back
+
+use:    From Python:    cmds.krConditionNetwork(compile = True)
+                        cmds.krConditionNetwork('krConditionFused1', restore = True)
+
+Flags:  compile = True      The default.  Each connected network of two or more of the nodes is replaced by a krConditionFused node.
+                            Returns a json string with the node count before and after, and the time to dirty and read the
+                            outputs before and after, with the speedup
+                            Nodes that can not be fused are skipped:  krMultiEqualCondition not in exact mode or with a table file,
+                            and anything with the vector, matrix or operation plugs connected
+        restore = True      Each krConditionFused node is replaced by the nodes it was compiled from
+
+Args:   name of object      The nodes to compile, or the krConditionFused nodes to restore - every node in the scene if nothing is selected
+        []                  List of objects to action
+'''
+
+# the number of times each network is dirtied and read for the timings
+NETWORK_TIMING_REPEATS = 20
+
+
+def time_network(node_names, plugs):
+    # the time to dirty the nodes and read the plugs, NETWORK_TIMING_REPEATS times
+    start = time.perf_counter()
+
+    for repeat in range(NETWORK_TIMING_REPEATS):
+        cmds.dgdirty(node_names)
+        for plug in plugs:
+            plug.asDouble()
+
+    return time.perf_counter() - start
+
+
+class ConditionNetwork(om.MPxCommand):
+
+    # define the command name
+    COMMAND_NAME = "krConditionNetwork"
+
+    # define the flag names
+    COMPILE_FLAG = ['-c', '-compile']
+    RESTORE_FLAG = ['-rs', '-restore']
+
+    def __init__(self):
+        super(ConditionNetwork, self).__init__()
+
+        # every change is made through the one modifier, so the undo and redo are a single step
+        self.modifier = None
+
+    def doIt(self, arg_list):
+        # create the arg database (from the syntax object) - try except incase of failure
+        try:
+            arg_db = om.MArgDatabase(self.syntax(), arg_list)
+        except:
+            self.displayError('Error parsing arguments')
+            raise
+
+        self.restore_flag_enabled = arg_db.isFlagSet(ConditionNetwork.RESTORE_FLAG[0])
+
+        self.modifier = om.MDGModifier()
+
+        # get the selection - every node in the scene if nothing is selected
+        selection_list = arg_db.getObjectList()
+        nodes = [selection_list.getDependNode(i) for i in range(selection_list.length())]
+
+        if not nodes:
+            node_iter = om.MItDependencyNodes(om.MFn.kPluginDependNode)
+            while not node_iter.isDone():
+                nodes.append(node_iter.thisNode())
+                node_iter.next()
+
+        if self.restore_flag_enabled:
+            self.restore([node for node in nodes if om.MFnDependencyNode(node).typeId == FusedConditionNode.TYPE_ID])
+        else:
+            self.compile([node for node in nodes if om.MFnDependencyNode(node).typeName in FUSED_NODE_PLUGS])
+
+    def isUndoable(self):
+        return True
+
+    def undoIt(self):
+        self.modifier.undoIt()
+
+    def redoIt(self):
+        self.modifier.doIt()
+
+    def fusible(self, node_fn):
+        # None if the node can be fused, otherwise the reason it can not
+        input_attrs, output_attr = FUSED_NODE_PLUGS[node_fn.typeName]
+
+        if node_fn.typeName == 'krMultiEqualCondition':
+            if node_fn.findPlug('match_mode', False).asShort() != MATCH_EXACT:
+                return 'not in exact match mode'
+            if node_fn.findPlug('table_file', False).asString():
+                return 'uses a table file'
+
+        for plug in node_fn.getConnections():
+            attr_name = om.MFnAttribute(plug.attribute()).name
+
+            if plug.isDestination and attr_name not in input_attrs:
+                return '{0} is connected'.format(plug.partialName(useLongNames=True))
+            if plug.isSource and attr_name != output_attr:
+                return '{0} is connected'.format(plug.partialName(useLongNames=True))
+
+        return None
+
+    def compile(self, nodes):
+        report = {'networks': [], 'skipped': [], 'nodes_before': 0, 'nodes_after': 0}
+
+        # the nodes that can be fused, by uuid
+        node_fns = {}
+        for node in nodes:
+            node_fn = om.MFnDependencyNode(node)
+            reason = self.fusible(node_fn)
+
+            if reason is None:
+                node_fns[node_fn.uuid().asString()] = node_fn
+            else:
+                report['skipped'].append({'name': node_fn.name(), 'reason': reason})
+
+        # join the nodes connected output to input into networks
+        network_ids = {uuid: uuid for uuid in node_fns}
+
+        def find(uuid):
+            while network_ids[uuid] != uuid:
+                uuid = network_ids[uuid]
+            return uuid
+
+        for uuid, node_fn in node_fns.items():
+            for input_attr in FUSED_NODE_PLUGS[node_fn.typeName][0]:
+                source = node_fn.findPlug(input_attr, False).source()
+                if source.isNull:
+                    continue
+
+                source_uuid = om.MFnDependencyNode(source.node()).uuid().asString()
+                if source_uuid in node_fns:
+                    network_ids[find(source_uuid)] = find(uuid)
+
+        networks = {}
+        for uuid in node_fns:
+            networks.setdefault(find(uuid), []).append(uuid)
+
+        total_before = 0.0
+        total_after = 0.0
+
+        # a single node has nothing to fuse with
+        for uuids in networks.values():
+            if len(uuids) < 2:
+                continue
+
+            try:
+                network_report = self.fuse([node_fns[uuid] for uuid in uuids])
+            except ValueError as error:
+                report['skipped'].extend({'name': node_fns[uuid].name(), 'reason': str(error)} for uuid in uuids)
+                continue
+
+            report['networks'].append(network_report)
+            report['nodes_before'] += len(uuids)
+            report['nodes_after'] += 1
+
+            total_before += network_report['time_before']
+            total_after += network_report['time_after']
+
+        report['speedup'] = total_before / total_after if total_after else 0.0
+
+        self.setResult(json.dumps(report))
+        om.MGlobal.displayInfo('krConditionNetwork:  {0} nodes fused into {1}, {2} skipped, {3:.1f}x faster'.format(report['nodes_before'],
+                                                                                                            report['nodes_after'],
+                                                                                                            len(report['skipped']),
+                                                                                                            report['speedup']))
+
+    def fuse(self, node_fns):
+        # replaces the nodes with a krConditionFused node, returning the report for the network
+        uuids = [node_fn.uuid().asString() for node_fn in node_fns]
+        network = {'nodes': [], 'connections': [], 'inputs': [], 'outputs': []}
+
+        # the plugs outside the network, to be connected to the inputs and outputs of the fused node
+        input_sources = []
+        input_indices = {}
+        output_destinations = []
+        output_plugs = []
+
+        for node_index, node_fn in enumerate(node_fns):
+            type_name = node_fn.typeName
+            values = {attr_name: read_plug_value(node_fn.findPlug(attr_name, False), kind) for attr_name, kind in FUSED_NODE_ATTRIBUTES[type_name]}
+            network['nodes'].append({'name': node_fn.name(), 'type': type_name, 'values': values})
+
+            input_attrs, output_attr = FUSED_NODE_PLUGS[type_name]
+
+            for input_attr in input_attrs:
+                source = node_fn.findPlug(input_attr, False).source()
+                if source.isNull:
+                    continue
+
+                source_uuid = om.MFnDependencyNode(source.node()).uuid().asString()
+
+                if source_uuid in uuids:
+                    network['connections'].append([uuids.index(source_uuid), om.MFnAttribute(source.attribute()).name, node_index, input_attr])
+                    continue
+
+                # a source outside the network feeding more than one node is still one input
+                if source.name() not in input_indices:
+                    input_indices[source.name()] = len(input_sources)
+                    input_sources.append(source)
+                    network['inputs'].append([])
+
+                network['inputs'][input_indices[source.name()]].append([node_index, input_attr])
+
+            output_plug = node_fn.findPlug(output_attr, False)
+            destinations = [destination for destination in output_plug.destinations()
+                            if om.MFnDependencyNode(destination.node()).uuid().asString() not in uuids]
+
+            if destinations:
+                network['outputs'].append([node_index, output_attr])
+                output_destinations.append(destinations)
+                output_plugs.append(output_plug)
+
+        # fail before anything is changed, if the network can not be compiled
+        compile_network(network)
+
+        node_names = [node_fn.name() for node_fn in node_fns]
+        time_before = time_network(node_names, output_plugs)
+
+        # create the fused node, then connect it in place of the network
+        fused_obj = self.modifier.createNode(FusedConditionNode.TYPE_ID)
+        self.modifier.doIt()
+
+        fused_fn = om.MFnDependencyNode(fused_obj)
+        self.modifier.newPlugValueString(fused_fn.findPlug('network', False), json.dumps(network))
+
+        inputs_plug = fused_fn.findPlug('inputs', False)
+        outputs_plug = fused_fn.findPlug('outputs', False)
+
+        for index, source in enumerate(input_sources):
+            self.modifier.connect(source, inputs_plug.elementByLogicalIndex(index))
+
+        for index, (output_plug, destinations) in enumerate(zip(output_plugs, output_destinations)):
+            for destination in destinations:
+                self.modifier.disconnect(output_plug, destination)
+                self.modifier.connect(outputs_plug.elementByLogicalIndex(index), destination)
+
+        for node_fn in node_fns:
+            self.modifier.deleteNode(node_fn.object())
+
+        self.modifier.doIt()
+
+        fused_outputs = [outputs_plug.elementByLogicalIndex(index) for index in range(len(output_plugs))]
+        time_after = time_network([fused_fn.name()], fused_outputs)
+
+        return {'fused': fused_fn.name(), 'nodes': node_names,
+                'inputs': len(input_sources), 'outputs': len(output_plugs),
+                'time_before': time_before, 'time_after': time_after,
+                'speedup': time_before / time_after if time_after else 0.0}
+
+    def restore(self, nodes):
+        restored = 0
+
+        for fused_obj in nodes:
+            fused_fn = om.MFnDependencyNode(fused_obj)
+
+            try:
+                network = json.loads(fused_fn.findPlug('network', False).asString())
+            except ValueError:
+                self.displayWarning('{0} has no network to restore'.format(fused_fn.name()))
+                continue
+
+            # create the nodes again
+            node_objs = []
+            for node in network['nodes']:
+                node_obj = self.modifier.createNode(node['type'])
+                self.modifier.renameNode(node_obj, node['name'])
+                node_objs.append(node_obj)
+
+            self.modifier.doIt()
+
+            node_fns = [om.MFnDependencyNode(node_obj) for node_obj in node_objs]
+
+            # set the values, and connect them as they were
+            for node_fn, node in zip(node_fns, network['nodes']):
+                for attr_name, kind in FUSED_NODE_ATTRIBUTES[node['type']]:
+                    write_plug_value(self.modifier, node_fn.findPlug(attr_name, False), kind, node['values'][attr_name])
+
+            for source_index, source_attr, node_index, attr in network['connections']:
+                self.modifier.connect(node_fns[source_index].findPlug(source_attr, False), node_fns[node_index].findPlug(attr, False))
+
+            # the inputs go back to the nodes they fed - an input that is no longer connected keeps its value
+            inputs_plug = fused_fn.findPlug('inputs', False)
+
+            for index, input_plugs in enumerate(network['inputs']):
+                input_plug = inputs_plug.elementByLogicalIndex(index)
+                source = input_plug.source()
+
+                for node_index, attr in input_plugs:
+                    plug = node_fns[node_index].findPlug(attr, False)
+
+                    if source.isNull:
+                        self.modifier.newPlugValueDouble(plug, input_plug.asDouble())
+                    else:
+                        self.modifier.connect(source, plug)
+
+            outputs_plug = fused_fn.findPlug('outputs', False)
+
+            for index, (node_index, attr) in enumerate(network['outputs']):
+                output_plug = outputs_plug.elementByLogicalIndex(index)
+
+                for destination in output_plug.destinations():
+                    self.modifier.disconnect(output_plug, destination)
+                    self.modifier.connect(node_fns[node_index].findPlug(attr, False), destination)
+
+            self.modifier.deleteNode(fused_obj)
+            self.modifier.doIt()
+
+            restored += len(node_objs)
+
+        self.setResult(restored)
+        om.MGlobal.displayInfo('krConditionNetwork:  {0} nodes restored'.format(restored))
+
+    @classmethod
+    def creator(cls):
+        return ConditionNetwork()
+
+    @classmethod
+    def create_syntax(cls):
+        # create the syntax
+        syntax = om.MSyntax()
+
+        # set the type, and if no attributes are passed, to use the current selection
+        syntax.setObjectType(om.MSyntax.kSelectionList, 0, None)
+        syntax.useSelectionAsDefault(True)
+
+        # add the flags
+        syntax.addFlag(ConditionNetwork.COMPILE_FLAG[0], ConditionNetwork.COMPILE_FLAG[1])
+        syntax.addFlag(ConditionNetwork.RESTORE_FLAG[0], ConditionNetwork.RESTORE_FLAG[1])
+
+        return syntax
+
+
+###########################
+### Command:  krTagged  ###
+###########################
+'''
+Purpose:    Find the objects tagged by krSelect, without searching the scene
+
+use:    From Python:    cmds.krTagged('attr_name')
+
+Args:   attr_name           The attribute given to krSelect.  Returns the objects with attr_name, then attr_name_1, attr_name_2 etc
+                            (from the text flag), in that order
+
+The objects come from the tag index - every dynamic, non keyable bool attribute on a transform or joint, by name.  It is kept
+up to date with callbacks:  new transforms are checked the next time the index is used, deleted ones are removed, the index is
+cleared before a new scene or a scene is opened, and attributes added or removed on tagged objects are picked up as they change.
+krSelect updates the index itself as it tags.
+'''
+
+# a numbered tag from the text flag - attr_name_2 is ('attr_name', '2')
+TAG_NUMBER = re.compile(r'^(.+)_(\d+)$')
+
+
+class TagIndex(object):
+    '''
+    the tagged objects in the scene, by the tag attribute name
+    '''
+
+    def __init__(self):
+        # {tag name: {node hash: MObjectHandle}} - by the full attribute name
+        self.tags = {}
+
+        # the numbered tag names that can be found through a shorter name - {'attr_name': {'attr_name_2': 2}}
+        self.numbered = {}
+
+        # the tag names of each node - {node hash: set of tag names}
+        self.node_tags = {}
+
+        # transforms added since the index was last used - {node hash: MObjectHandle}
+        self.pending = {}
+
+        # the whole scene is checked the first time the index is used
+        self.scan_scene = True
+
+        self.callback_ids = []
+        self.node_callback_ids = {}
+
+    def install(self):
+        self.scan_scene = True
+
+        self.callback_ids.append(om.MDGMessage.addNodeAddedCallback(TagIndex.node_added, 'transform', self))
+        self.callback_ids.append(om.MDGMessage.addNodeRemovedCallback(TagIndex.node_removed, 'transform', self))
+        self.callback_ids.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeNew, TagIndex.scene_cleared, self))
+        self.callback_ids.append(om.MSceneMessage.addCallback(om.MSceneMessage.kBeforeOpen, TagIndex.scene_cleared, self))
+
+    def uninstall(self):
+        self.clear()
+
+        for callback_id in self.callback_ids:
+            om.MMessage.removeCallback(callback_id)
+        self.callback_ids = []
+
+    def clear(self):
+        for callback_id in self.node_callback_ids.values():
+            om.MMessage.removeCallback(callback_id)
+
+        self.tags = {}
+        self.numbered = {}
+        self.node_tags = {}
+        self.pending = {}
+        self.node_callback_ids = {}
+
+    @staticmethod
+    def is_tag(node_fn, attr_obj):
+        # a dynamic, non keyable bool - the attributes krSelect adds
+        if node_fn.attributeClass(attr_obj) != om.MFnDependencyNode.kLocalDynamicAttr or not attr_obj.hasFn(om.MFn.kNumericAttribute):
+            return False
+
+        attr_fn = om.MFnNumericAttribute(attr_obj)
+        return attr_fn.numericType() == om.MFnNumericData.kBoolean and not attr_fn.keyable
+
+    def add(self, node, tag_name):
+        handle = om.MObjectHandle(node)
+        node_hash = handle.hashCode()
+
+        self.tags.setdefault(tag_name, {})[node_hash] = handle
+        self.node_tags.setdefault(node_hash, set()).add(tag_name)
+
+        match = TAG_NUMBER.match(tag_name)
+        if match is not None:
+            self.numbered.setdefault(match.group(1), {})[tag_name] = int(match.group(2))
+
+        # tagged nodes are watched for their attributes being added or removed
+        if node_hash not in self.node_callback_ids:
+            self.node_callback_ids[node_hash] = om.MNodeMessage.addAttributeAddedOrRemovedCallback(node, TagIndex.attribute_added_or_removed, self)
+
+    def remove(self, node, tag_name):
+        node_hash = om.MObjectHandle(node).hashCode()
+        self.discard(node_hash, tag_name)
+
+        node_tags = self.node_tags.get(node_hash, set())
+        node_tags.discard(tag_name)
+
+        if not node_tags:
+            self.forget(node_hash)
+
+    def discard(self, node_hash, tag_name):
+        # removes one node from a tag, and the tag once no node has it
+        nodes = self.tags.get(tag_name)
+        if nodes is None:
+            return
+
+        nodes.pop(node_hash, None)
+        if nodes:
+            return
+
+        del self.tags[tag_name]
+
+        match = TAG_NUMBER.match(tag_name)
+        if match is not None:
+            numbered = self.numbered.get(match.group(1), {})
+            numbered.pop(tag_name, None)
+            if not numbered:
+                self.numbered.pop(match.group(1), None)
+
+    def forget(self, node_hash):
+        # removes everything about a node
+        for tag_name in self.node_tags.pop(node_hash, ()):
+            self.discard(node_hash, tag_name)
+
+        self.pending.pop(node_hash, None)
+
+        callback_id = self.node_callback_ids.pop(node_hash, None)
+        if callback_id is not None:
+            om.MMessage.removeCallback(callback_id)
+
+    def scan(self, node):
+        node_fn = om.MFnDependencyNode(node)
+
+        # the dynamic attributes come after the node's own attributes, so only the end of the list is checked
+        for index in reversed(range(node_fn.attributeCount())):
+            attr_obj = node_fn.attribute(index)
+            if node_fn.attributeClass(attr_obj) != om.MFnDependencyNode.kLocalDynamicAttr:
+                break
+
+            if TagIndex.is_tag(node_fn, attr_obj):
+                self.add(node, om.MFnAttribute(attr_obj).name)
+
+    def resolve(self):
+        # checks the transforms that have not been checked yet
+        if self.scan_scene:
+            node_iter = om.MItDependencyNodes(om.MFn.kTransform)
+            while not node_iter.isDone():
+                handle = om.MObjectHandle(node_iter.thisNode())
+                self.pending[handle.hashCode()] = handle
+                node_iter.next()
+
+            self.scan_scene = False
+
+        for handle in self.pending.values():
+            if handle.isValid():
+                self.scan(handle.object())
+
+        self.pending = {}
+
+    def find(self, name, numbered=True):
+        # the nodes tagged with name, then name_1, name_2 etc - a list of (node, tag name).  Only name when numbered is False
+        self.resolve()
+
+        numbered = self.numbered.get(name, {}) if numbered else {}
+        tag_names = [name] + sorted(numbered, key=lambda tag_name: (numbered[tag_name], tag_name))
+
+        return [(handle.object(), tag_name) for tag_name in tag_names
+                for handle in self.tags.get(tag_name, {}).values() if handle.isValid()]
+
+    @staticmethod
+    def node_added(node, tag_index):
+        handle = om.MObjectHandle(node)
+        tag_index.pending[handle.hashCode()] = handle
+
+    @staticmethod
+    def node_removed(node, tag_index):
+        tag_index.forget(om.MObjectHandle(node).hashCode())
+
+    @staticmethod
+    def scene_cleared(tag_index):
+        # the nodes of the next scene are added through node_added
+        tag_index.clear()
+        tag_index.scan_scene = False
+
+    @staticmethod
+    def attribute_added_or_removed(msg, plug, tag_index):
+        node = plug.node()
+        tag_name = om.MFnAttribute(plug.attribute()).name
+
+        if msg & om.MNodeMessage.kAttributeAdded:
+            if TagIndex.is_tag(om.MFnDependencyNode(node), plug.attribute()):
+                tag_index.add(node, tag_name)
+
+        elif msg & om.MNodeMessage.kAttributeRemoved:
+            tag_index.remove(node, tag_name)
+
+
+# the index used by krSelect and krTagged - the callbacks are installed with the plugin
+TAG_INDEX = TagIndex()
+
+
+class TaggedQuery(om.MPxCommand):
+
+    # define the command name
+    COMMAND_NAME = "krTagged"
+
+    def __init__(self):
+        super(TaggedQuery, self).__init__()
+
+    def doIt(self, arg_list):
+        # create the arg database (from the syntax object) - try except incase of failure
+        try:
+            arg_db = om.MArgDatabase(self.syntax(), arg_list)
+        except:
+            self.displayError('Error parsing arguments')
+            raise
+
+        name = arg_db.commandArgumentString(0)
+
+        # the shortest unique name of each tagged object
+        self.setResult([om.MDagPath.getAPathTo(node).partialPathName() for node, tag_name in TAG_INDEX.find(name)])
+
+    @classmethod
+    def creator(cls):
+        return TaggedQuery()
+
+    @classmethod
+    def create_syntax(cls):
+        # create the syntax
+        syntax = om.MSyntax()
+
+        # the attribute name
+        syntax.addArg(om.MSyntax.kString)
+
+        return syntax
+
+
 ##################################
 ### Context Command:  krSelect ###
 ##################################
@@ -535,21 +3350,30 @@ class SelectObjectContext(omui.MPxContext):
         self.help_text = 'Test'
         self.help2 = None
         
+        # the pick mask to use while the tool is active (set by the mesh and joint flags), and the one to restore after
+        self.pick_mask = None
+        self.saved_mask = None
+        
         
         
 
     def toolOnSetup(self, event):
         om.MGlobal.selectCommand(om.MSelectionList())
+        
+        # save the pick mask once, then set the one for the tool
+        if self.pick_mask is not None:
+            self.saved_mask = om.MGlobal.objectSelectionMask()
+            om.MGlobal.setObjectSelectionMask(self.pick_mask)
+        
         self.reset_state()
         self.update_help()
         
     def toolOffCleanup(self):
-        mel.eval('setObjectPickMask "Joint" true')
-        mel.eval('setObjectPickMask "Curve" true')
-        mel.eval('setObjectPickMask "Surface" true')
-        mel.eval('setObjectPickMask "Deformer" true')
-        mel.eval('setObjectPickMask "Dynamic" true')
-        mel.eval('setObjectPickMask "Rendering" true')    
+        # put the pick mask back as it was - complete and abort both end here
+        if self.saved_mask is not None:
+            om.MGlobal.setObjectSelectionMask(self.saved_mask)
+            self.saved_mask = None
+        
         self.reset_state()
         self.help_text = ''
         cmds.setAttr(self.my_help + '.text_display', self.help_text, type = 'string')
@@ -605,58 +3429,35 @@ class SelectObjectContext(omui.MPxContext):
         self.update_state()
             
     def completeAction(self):
-        # create the selection list
         selection_count = self.context_selection.length()
-        self.selection_list = []
-        
         
+        # clear the om.selection list
         if selection_count > 0:
-            # clear the om.selection list
             om.MGlobal.setActiveSelectionList(om.MSelectionList())
-            
-            for index in range(selection_count):
-                transform_fn = om.MFnTransform(self.context_selection.getDependNode(index))
-                
-                # get the name of the selection item
-                name = transform_fn.name()
-                
-                # add it to the selection list
-                self.selection_list.append(name)
-                
+        
         # if the attribute is passed
         if self.attr:
-            # clear the attribute if set on any item in the scene
-            
-            # get all items in the scene
-            all_items = cmds.ls()
-            
             # get the attr argument
             long_name = self.attr
             
-            # iterate through the scene, and check for anything that already has the attribute.
-            for item in all_items:
-                if cmds.attributeQuery(long_name, node = item, exists = True):
-                    
-                    # if the item has the attribute, then delete it
-                    cmds.deleteAttr(item, attribute = long_name)
+            # the tags are changed by one tool command, so it is a single undo
+            tool_cmd = self._newToolCommand()
+            
+            # clear the attribute if set on any item in the scene - and the numbered attributes, only when they are being set
+            # again with the text flag, so a separate attr_name_2 tag is left alone
+            tool_cmd.remove_tags(TAG_INDEX.find(long_name, bool(self.help2)))
             
             # iterate through the selection, then add the attribute to the selected items
-            count = 1
-            for item in self.selection_list:
+            for index in range(selection_count):
                 if self.help2:
-                    my_attr = cmds.addAttr(item, longName = f'{long_name}_{count}', attributeType = 'bool', keyable = False)
-                    cmds.setAttr(f'{item}.{self.attr}_{count}', True)
+                    tag_name = f'{long_name}_{index + 1}'
                 else:
-                    my_attr = cmds.addAttr(item, longName = long_name, attributeType = 'bool', keyable = False)
-                    cmds.setAttr(f'{item}.{self.attr}', True)
-                count += 1
-             
-        mel.eval('setObjectPickMask "Joint" true')
-        mel.eval('setObjectPickMask "Curve" true')
-        mel.eval('setObjectPickMask "Surface" true')
-        mel.eval('setObjectPickMask "Deformer" true')
-        mel.eval('setObjectPickMask "Dynamic" true')
-        mel.eval('setObjectPickMask "Rendering" true')       
+                    tag_name = long_name
+                
+                tool_cmd.add_tag(self.context_selection.getDependNode(index), tag_name)
+            
+            tool_cmd.redoIt()
+            tool_cmd.finalize()
         
         self.reset_state()
         self.help_text = ''
@@ -712,6 +3513,96 @@ class SelectObjectContext(omui.MPxContext):
             pass
         
         
+class TagObjectsToolCmd(omui.MPxToolCommand):
+    '''
+    removes the old tags and adds the new ones for krSelect, through one modifier - undone and redone as a single step
+    '''
+    
+    COMMAND_NAME = 'krSelectTag'
+    
+    def __init__(self):
+        super(TagObjectsToolCmd, self).__init__()
+        self.setCommandString(TagObjectsToolCmd.COMMAND_NAME)
+        
+        self.modifier = om.MDGModifier()
+        
+        # the tags removed and added - (node, tag name).  Existing are attributes already on the node, that are set instead
+        self.removed = []
+        self.added = []
+        self.existing = []
+        
+        # the removed tags, by (node hash, tag name)
+        self.removed_keys = set()
+        
+    def remove_tags(self, tags):
+        # tags from the tag index, the attribute and the numbered attributes used with the text flag
+        for node, tag_name in tags:
+            node_fn = om.MFnDependencyNode(node)
+            
+            if node_fn.hasAttribute(tag_name):
+                self.modifier.removeAttribute(node, node_fn.attribute(tag_name))
+                self.removed.append((node, tag_name))
+                self.removed_keys.add((om.MObjectHandle(node).hashCode(), tag_name))
+        
+    def add_tag(self, node, tag_name):
+        node_fn = om.MFnDependencyNode(node)
+        
+        # the node is checked rather than the index - the index does not see attributes other tools add to untagged nodes
+        if node_fn.hasAttribute(tag_name) and (om.MObjectHandle(node).hashCode(), tag_name) not in self.removed_keys:
+            attr_obj = node_fn.attribute(tag_name)
+            
+            if node_fn.attributeClass(attr_obj) != om.MFnDependencyNode.kLocalDynamicAttr:
+                om.MGlobal.displayWarning('{0} already has a {1} attribute of its own, so is not tagged'.format(node_fn.name(), tag_name))
+                return
+            
+            self.modifier.newPlugValueBool(node_fn.findPlug(attr_obj, False), True)
+            self.existing.append((node, tag_name))
+            return
+        
+        # the attribute defaults to true, so it does not need setting as well
+        numeric_attr = om.MFnNumericAttribute()
+        attr_obj = numeric_attr.create(tag_name, tag_name, om.MFnNumericData.kBoolean, True)
+        numeric_attr.keyable = False
+        
+        self.modifier.addAttribute(node, attr_obj)
+        self.added.append((node, tag_name))
+        
+    def doIt(self, args):
+        self.redoIt()
+        
+    def redoIt(self):
+        self.modifier.doIt()
+        
+        # keep the tag index up to date
+        for node, tag_name in self.removed:
+            TAG_INDEX.remove(node, tag_name)
+        for node, tag_name in self.added + self.existing:
+            TAG_INDEX.add(node, tag_name)
+        
+    def undoIt(self):
+        self.modifier.undoIt()
+        
+        for node, tag_name in self.added:
+            TAG_INDEX.remove(node, tag_name)
+        for node, tag_name in self.removed:
+            TAG_INDEX.add(node, tag_name)
+        
+    def isUndoable(self):
+        return True
+        
+    def finalize(self):
+        # records the command for the undo queue
+        return self._doFinalize(om.MArgList())
+        
+    @classmethod
+    def creator(cls):
+        return TagObjectsToolCmd()
+        
+    @classmethod
+    def create_syntax(cls):
+        return om.MSyntax()
+        
+        
 class SelectObjectContextCmd(omui.MPxContextCommand):
     COMMAND_NAME = 'krSelect'
     
@@ -763,24 +3654,15 @@ class SelectObjectContextCmd(omui.MPxContextCommand):
         number = None
         
         # check for mesh flag
+        # the pick mask is set when the tool is set up, and put back when it is finished
         if args.isFlagSet('-m'):
             self.my_context.set_mesh = True
-            mel.eval('setObjectPickMask "Joint" false')
-            mel.eval('setObjectPickMask "Curve" false')
-            mel.eval('setObjectPickMask "Surface" true')
-            mel.eval('setObjectPickMask "Deformer" false')
-            mel.eval('setObjectPickMask "Dynamic" false')
-            mel.eval('setObjectPickMask "Rendering" false')           
+            self.my_context.pick_mask = om.MSelectionMask(om.MSelectionMask.kSelectMeshes)
 
         # check for joint flag
         if args.isFlagSet('-j'):
             self.my_context.set_joint = True
-            mel.eval('setObjectPickMask "Joint" true')
-            mel.eval('setObjectPickMask "Curve" false')
-            mel.eval('setObjectPickMask "Surface" false')
-            mel.eval('setObjectPickMask "Deformer" false')
-            mel.eval('setObjectPickMask "Dynamic" false')
-            mel.eval('setObjectPickMask "Rendering" false')       
+            self.my_context.pick_mask = om.MSelectionMask(om.MSelectionMask.kSelectJoints)
             
 
         
@@ -846,11 +3728,17 @@ class SelectObjectContextCmd(omui.MPxContextCommand):
 '''
 Purpose:    Transfer the existing transform attributes to the offset parent matrix
             If selection is a joint, then the joint orient will also be transferred and cleared
+            Nodes with nothing to transfer (cleared transform attributes, or no offset parent matrix to reverse) are skipped,
+            so running it again over a whole rig only costs as much as the nodes that have changed
 
 use:    From Python:    cmds.krTxToOffset()
         Toolbar:        script can be saved to the toolbar, then will act on the selection - one or more items can be selected
 
-Flags:  reverse = True  Transfer the offset parent matrix back to the transform attributes
+Flags:  reverse = True      Transfer the offset parent matrix back to the transform attributes
+        hierarchy = True    Process every transform and joint below the selected items, parents first
+        dryRun = True       Nothing is changed.  Returns a json string with the action for each node (skip, forward,
+                            reverse_forward or reverse) and the time taken by each phase (resolve, read, compute, write)
+        query = True        The same as dryRun
         
 Args:   name of object      The name of the object to action
         []                  List of objects to action
@@ -859,6 +3747,246 @@ Args:   name of object      The name of the object to action
                 number = 2                  Optional    maximum number of items to be selected.  Unlimited if not used
 '''
 
+IDENTITY_MATRIX = [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]
+
+# how close to the identity a matrix has to be for it to be left alone
+IDENTITY_TOLERANCE = 1.0e-9
+
+# the channels that are cleared by the transfer, and the values they are cleared to
+TRANSFORM_CHANNELS = ('translateX', 'translateY', 'translateZ',
+                      'rotateX', 'rotateY', 'rotateZ',
+                      'scaleX', 'scaleY', 'scaleZ',
+                      'shearXY', 'shearXZ', 'shearYZ')
+JOINT_CHANNELS = ('jointOrientX', 'jointOrientY', 'jointOrientZ')
+
+CLEARED_VALUES = (0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 1.0, 1.0, 1.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0)
+
+# what the transfer will do with each node
+ACTION_SKIP = 'skip'
+ACTION_FORWARD = 'forward'
+ACTION_REVERSE_FORWARD = 'reverse_forward'
+ACTION_REVERSE = 'reverse'
+
+class TransferBatch(object):
+    '''
+    The transforms and joints of one krTxToOffset call.
+
+    The selection is resolved once, then every matrix is read from the plugs directly in a single pass,
+    and every change is applied through a single MDGModifier
+    '''
+
+    # the attribute objects are shared by every transform and joint, so they are only looked up once
+    _attributes = None
+
+    def __init__(self):
+        self.nodes = []
+        self.names = []
+        self.joints = []
+
+        # hash codes of the nodes already in the batch, so overlapping selections are only processed once
+        self.node_hashes = set()
+
+        # filled in by read()
+        self.local_matrices = []
+        self.offset_matrices = []
+        self.rotate_orders = []
+        self.local_array = None
+        self.offset_array = None
+
+    @classmethod
+    def attributes(cls):
+        if cls._attributes is None:
+            transform_class = om.MNodeClass('transform')
+            joint_class = om.MNodeClass('joint')
+
+            cls._attributes = {'matrix': transform_class.attribute('matrix'),
+                               'offsetParentMatrix': transform_class.attribute('offsetParentMatrix'),
+                               'rotateOrder': transform_class.attribute('rotateOrder'),
+                               'channels': [transform_class.attribute(name) for name in TRANSFORM_CHANNELS],
+                               'joint_channels': [joint_class.attribute(name) for name in JOINT_CHANNELS]}
+
+        return cls._attributes
+
+    def add(self, obj):
+        # only transforms and joints can be processed - returns False for anything else
+        depend_fn = om.MFnDependencyNode(obj)
+        obj_type = depend_fn.typeName
+
+        if obj_type != 'transform' and obj_type != 'joint':
+            return False
+
+        node_hash = om.MObjectHandle(obj).hashCode()
+        if node_hash in self.node_hashes:
+            return True
+        self.node_hashes.add(node_hash)
+
+        self.nodes.append(obj)
+        self.names.append(om.MDagPath.getAPathTo(obj).partialPathName())
+        self.joints.append(obj_type == 'joint')
+
+        return True
+
+    def add_hierarchy(self, root):
+        # walk the subtree depth first, so that every parent is added before its children
+        dag_iter = om.MItDag(om.MItDag.kDepthFirst, om.MFn.kTransform)
+        dag_iter.reset(root, om.MItDag.kDepthFirst, om.MFn.kTransform)
+
+        # anything that is not a transform or joint (constraints, ik handles, etc) is skipped silently
+        while not dag_iter.isDone():
+            self.add(dag_iter.currentItem())
+            dag_iter.next()
+
+    def read(self):
+        # read the local and offset parent matrices, and the rotate order, of every node in one pass
+        attributes = TransferBatch.attributes()
+        matrix_attr = attributes['matrix']
+        offset_attr = attributes['offsetParentMatrix']
+        rotate_order_attr = attributes['rotateOrder']
+
+        self.local_matrices = []
+        self.offset_matrices = []
+        self.rotate_orders = []
+
+        for node in self.nodes:
+            self.local_matrices.append(om.MFnMatrixData(om.MPlug(node, matrix_attr).asMObject()).matrix())
+            self.offset_matrices.append(om.MFnMatrixData(om.MPlug(node, offset_attr).asMObject()).matrix())
+            self.rotate_orders.append(om.MPlug(node, rotate_order_attr).asShort())
+
+        # the same matrices as (N, 4, 4) arrays for the kernel
+        if np is not None:
+            self.local_array = np.array([list(matrix) for matrix in self.local_matrices], dtype=np.float64).reshape(-1, 4, 4)
+            self.offset_array = np.array([list(matrix) for matrix in self.offset_matrices], dtype=np.float64).reshape(-1, 4, 4)
+
+    def matrix_arrays(self):
+        return self.local_array, self.offset_array
+
+    def plan(self, reverse):
+        # work out the action for every node, from whether the local and offset parent matrices are identity
+        if krMatrixKernel is not None:
+            local_identity = krMatrixKernel.identity_mask(self.local_array, IDENTITY_TOLERANCE).tolist()
+            offset_identity = krMatrixKernel.identity_mask(self.offset_array, IDENTITY_TOLERANCE).tolist()
+        else:
+            identity = om.MMatrix(IDENTITY_MATRIX)
+            local_identity = [matrix.isEquivalent(identity, IDENTITY_TOLERANCE) for matrix in self.local_matrices]
+            offset_identity = [matrix.isEquivalent(identity, IDENTITY_TOLERANCE) for matrix in self.offset_matrices]
+
+        actions = []
+
+        for local_is_identity, offset_is_identity in zip(local_identity, offset_identity):
+            if reverse:
+                # nothing to reverse if there is no offset parent matrix
+                actions.append(ACTION_SKIP if offset_is_identity else ACTION_REVERSE)
+            elif local_is_identity:
+                # nothing to transfer if the transform attributes are already cleared
+                actions.append(ACTION_SKIP)
+            elif offset_is_identity:
+                actions.append(ACTION_FORWARD)
+            else:
+                actions.append(ACTION_REVERSE_FORWARD)
+
+        return actions
+
+    def subset(self, indices):
+        # a new batch with only the given nodes, keeping the matrices already read
+        batch = TransferBatch()
+
+        batch.nodes = [self.nodes[i] for i in indices]
+        batch.names = [self.names[i] for i in indices]
+        batch.joints = [self.joints[i] for i in indices]
+        batch.node_hashes = set(om.MObjectHandle(node).hashCode() for node in batch.nodes)
+
+        batch.local_matrices = [self.local_matrices[i] for i in indices]
+        batch.offset_matrices = [self.offset_matrices[i] for i in indices]
+        batch.rotate_orders = [self.rotate_orders[i] for i in indices]
+
+        if np is not None:
+            batch.local_array = self.local_array[list(indices)]
+            batch.offset_array = self.offset_array[list(indices)]
+
+        return batch
+
+    def write(self, offsets, values):
+        # offsets:  one MMatrix per node
+        # values:   one list of channel values per node, in TRANSFORM_CHANNELS then JOINT_CHANNELS order
+        attributes = TransferBatch.attributes()
+        offset_attr = attributes['offsetParentMatrix']
+
+        modifier = om.MDGModifier()
+
+        for node, is_joint, offset, node_values in zip(self.nodes, self.joints, offsets, values):
+            # set the offset parent matrix
+            matrix_data = om.MFnMatrixData().create(offset)
+            modifier.newPlugValue(om.MPlug(node, offset_attr), matrix_data)
+
+            # set the transform channels, and the joint orient if a joint
+            channels = attributes['channels']
+            if is_joint:
+                channels = channels + attributes['joint_channels']
+
+            for attr, value in zip(channels, node_values):
+                modifier.newPlugValueDouble(om.MPlug(node, attr), value)
+
+        # apply every change at once
+        modifier.doIt()
+
+        return modifier
+
+    def snapshot(self):
+        # record the offset parent matrix and channel values of every node into two flat arrays
+        # 16 doubles per node for the matrices, and 15 per node for the channels (the joint orient is zero for transforms)
+        # the offset parent matrices were already read by read(), so only the channels are read here
+        attributes = TransferBatch.attributes()
+
+        offsets = array('d')
+        values = array('d')
+
+        for node, is_joint, offset in zip(self.nodes, self.joints, self.offset_matrices):
+            offsets.extend(offset)
+            values.extend(om.MPlug(node, attr).asDouble() for attr in attributes['channels'])
+
+            if is_joint:
+                values.extend(om.MPlug(node, attr).asDouble() for attr in attributes['joint_channels'])
+            else:
+                values.extend((0.0, 0.0, 0.0))
+
+        return TransferSnapshot(offsets, values)
+
+    def written_snapshot(self, offsets, values):
+        # the same as snapshot, from the offsets and values given to write - nothing is read back from the nodes
+        snapshot_offsets = array('d')
+        snapshot_values = array('d')
+
+        for is_joint, offset, node_values in zip(self.joints, offsets, values):
+            snapshot_offsets.extend(offset)
+            snapshot_values.extend(node_values[:len(TRANSFORM_CHANNELS)])
+
+            # only joints have the joint orient written
+            if is_joint:
+                snapshot_values.extend(node_values[len(TRANSFORM_CHANNELS):])
+            else:
+                snapshot_values.extend((0.0, 0.0, 0.0))
+
+        return TransferSnapshot(snapshot_offsets, snapshot_values)
+
+    def restore(self, snapshot):
+        # write a snapshot back in a single bulk write
+        node_count = len(self.nodes)
+        offsets = [om.MMatrix(snapshot.offsets[i * 16:(i + 1) * 16]) for i in range(node_count)]
+        values = [snapshot.values[i * 15:(i + 1) * 15] for i in range(node_count)]
+
+        return self.write(offsets, values)
+
+
+class TransferSnapshot(object):
+    '''
+    The state of a TransferBatch, stored in flat arrays of doubles so the memory stays proportional to the node count
+    '''
+
+    def __init__(self, offsets, values):
+        self.offsets = offsets
+        self.values = values
+
+
 class TransferToOffset(om.MPxCommand):
 
     # define the command name
@@ -867,12 +3995,22 @@ class TransferToOffset(om.MPxCommand):
     # define the flag names
     VERSION_FLAG = ['-v', '-version']
     REVERSE_FLAG = ['-r', '-reverse']
+    HIERARCHY_FLAG = ['-hi', '-hierarchy']
+    DRY_RUN_FLAG = ['-dr', '-dryRun']
 
     def __init__(self):
         super(TransferToOffset, self).__init__()
-        self.undoable = True
+
+        # the state of the batch before and after the transfer, used by the undo and redo
+        self.batch = None
+        self.before = None
+        self.after = None
 
     def doIt(self, arg_list):
+        # the time taken by each phase, for the dry run report
+        timings = {'resolve': 0.0, 'read': 0.0, 'compute': 0.0, 'write': 0.0}
+        phase_start = time.perf_counter()
+
         # create the arg database (from the syntax object) - try except incase of failure
         try:
             arg_db = om.MArgDatabase(self.syntax(), arg_list)
@@ -880,110 +4018,165 @@ class TransferToOffset(om.MPxCommand):
             self.displayError('Error parsing arguments')
             raise
         
-        # check whether the flags were used
+        # check whether the flags were used - query mode is the same as a dry run
         self.reverse_flag_enabled = arg_db.isFlagSet(TransferToOffset.REVERSE_FLAG[0])
         self.version_flag_enabled = arg_db.isFlagSet(TransferToOffset.VERSION_FLAG[0])
+        self.hierarchy_flag_enabled = arg_db.isFlagSet(TransferToOffset.HIERARCHY_FLAG[0])
+        self.dry_run_flag_enabled = arg_db.isFlagSet(TransferToOffset.DRY_RUN_FLAG[0]) or arg_db.isQuery
         
         # get the selection
         selection_list = arg_db.getObjectList()
 
-        self.my_selection = []
-        
-        # make a list of the object names, current world space matrix and offset parent matrix (for use in the undo)
+        # resolve the selection once - only transforms and joints are added to the batch
+        self.batch = TransferBatch()
+
         for i in range(selection_list.length()):
-            depend_fn = om.MFnDependencyNode(selection_list.getDependNode(i))
-            obj_name = depend_fn.name()
-            obj_type = cmds.nodeType(obj_name)
-            if obj_type == 'transform' or obj_type == 'joint':
-                self.my_selection.append(obj_name)
-            else:
+            obj = selection_list.getDependNode(i)
+
+            # with the hierarchy flag, each selected item is the root of a subtree to be processed
+            if self.hierarchy_flag_enabled and obj.hasFn(om.MFn.kTransform):
+                self.batch.add_hierarchy(obj)
+            elif not self.batch.add(obj):
+                obj_name = om.MFnDependencyNode(obj).name()
                 self.displayWarning('{0} cannot be processed as it is not a transform or joint node.'.format(obj_name))
-            
+
         # version flag to test 2 flags
         if self.version_flag_enabled:
             self.setResult('1.0.0')
-            
-        if self.my_selection == []:
+
+        if not self.batch.nodes:
             self.displayWarning('At least one object selection is required.  Please either select a valid object or pass in as an attribute')
+            return
+
+        timings['resolve'] = time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
+
+        # read every matrix needed by the transfer, parents before children
+        self.batch.read()
+
+        timings['read'] = time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
+
+        # work out what will happen to each node, then only keep the nodes that will change
+        actions = self.batch.plan(self.reverse_flag_enabled)
+
+        full_batch = self.batch
+        self.batch = full_batch.subset([i for i, action in enumerate(actions) if action != ACTION_SKIP])
+
+        if self.reverse_flag_enabled:
+            offsets, values = self.fm_offset()
         else:
-            # set the initial state of all objects, including their current offset parent matrices
-            for obj in self.my_selection:
-                if self.reverse_flag_enabled:
-                    self.fm_offset(obj)
-                else:
-                    self.to_offset(obj)
-        
-    def to_offset(self, obj_name):
-        # get the current offset parent matrix
-        current_offset = cmds.getAttr(obj_name + '.offsetParentMatrix')
-        
-        # get the object type
-        obj_type = cmds.nodeType(obj_name)
-        
-        # check if there is an offset parent matrix, and if so, reverse it using the reverse function
-        if current_offset != [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0]:
-            self.fm_offset(obj_name)
-        
-        # get the current local space matrix
-        current_xform = cmds.xform(obj_name, query = True, matrix = True)
-        
-        # copy the world space matrix to the offsetParentMatrix
-        cmds.setAttr(obj_name + '.offsetParentMatrix', current_xform, type = 'matrix')
-        
-        # reset all of the transform attributes to zero - cancelling out the offset parent matrix
-        cmds.move(0, 0, 0, obj_name, localSpace = True)  # ls is local space
-        cmds.rotate(0, 0, 0, obj_name)
-        cmds.scale(1, 1, 1, obj_name)
-        cmds.setAttr(obj_name + '.shear', 0, 0, 0)     
-        
-        # if a joint, zero the joint orient
-        if obj_type == 'joint':
-            cmds.setAttr(obj_name + '.jointOrient', 0, 0, 0)
+            offsets, values = self.to_offset()
 
-    def fm_offset(self, obj_name):
-        # get the object type
-        obj_type = cmds.nodeType(obj_name)
-        
-        # get the name of the parent
-        obj_parent = cmds.listRelatives(obj_name, parent = True)
-        
-        # if the object has a parent, move the object to the world parent
-        if obj_parent is not None:
-            cmds.parent(obj_name, world = True)
-        
-        # get the world space for the object
-        obj_xform = cmds.xform(obj_name, query = True, matrix = True, worldSpace = True)
-        
-        # convert the xform to an MMatrix object
-        obj_matrix = om.MMatrix(obj_xform)
-        
-        # convert the MMatrix object to a matrix
-        obj_transform_matrix = om.MTransformationMatrix(obj_matrix)
-        
-        # get the rotation, translation, scale and shear values
-        rot = obj_transform_matrix.rotation()
-        trn = obj_transform_matrix.translation(1)
-        scl = obj_transform_matrix.scale(1)
-        shr = obj_transform_matrix.shear(1)
-        
-        # transfer the rotation radians to degrees
-        rot_x = om.MAngle(rot.x).asDegrees()
-        rot_y = om.MAngle(rot.y).asDegrees()
-        rot_z = om.MAngle(rot.z).asDegrees()
+        timings['compute'] = time.perf_counter() - phase_start
+        phase_start = time.perf_counter()
 
-        # set the translate
-        cmds.move(trn[0], trn[1], trn[2], obj_name, localSpace = True)       
-        cmds.rotate(rot_x, rot_y, rot_z, obj_name)
-        cmds.scale(scl[0], scl[1], scl[2], obj_name)
-        cmds.setAttr(obj_name + '.shear', shr[0], shr[1], shr[2])
+        # the dry run reports what would be done, without changing the scene
+        if self.dry_run_flag_enabled:
+            self.set_report(full_batch, actions, timings)
+            return
 
-        # reset the offsetParentMatrix
-        cmds.setAttr(obj_name + '.offsetParentMatrix', [1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0, 0.0, 1.0], type = 'matrix')
+        if self.batch.nodes:
+            # record the state before and after the transfer, so the undo and redo are a single write each
+            self.before = self.batch.snapshot()
+            self.batch.write(offsets, values)
+            self.after = self.batch.written_snapshot(offsets, values)
 
-        # reparent the object if required
-        if obj_parent is not None:
-            cmds.parent(obj_name, obj_parent)
-            
+        timings['write'] = time.perf_counter() - phase_start
+
+    def set_report(self, batch, actions, timings):
+        # the report is returned as a json string:  {'nodes': [{'name', 'action'}, ...], 'timings': {phase: seconds}}
+        report = {'nodes': [{'name': name, 'action': action} for name, action in zip(batch.names, actions)],
+                  'timings': timings}
+
+        self.setResult(json.dumps(report))
+
+        skipped = actions.count(ACTION_SKIP)
+        om.MGlobal.displayInfo('krTxToOffset dry run:  {0} of {1} nodes would change, {2} skipped'.format(len(actions) - skipped, len(actions), skipped))
+
+    def isUndoable(self):
+        # only undoable if there was something transferred
+        return self.before is not None
+
+    def undoIt(self):
+        self.batch.restore(self.before)
+
+    def redoIt(self):
+        self.batch.restore(self.after)
+
+    def to_offset(self):
+        # returns the new offset parent matrices and channel values of the batch
+        local_matrices = self.batch.local_matrices
+        offset_matrices = self.batch.offset_matrices
+
+        # the local matrix is moved onto the offset parent matrix.  If there is already an offset parent matrix,
+        # it is combined with the local matrix - the same result as reversing it first, without the extra writes
+        if krMatrixKernel is not None:
+            local_array, offset_array = self.batch.matrix_arrays()
+
+            # offsets within the tolerance of the identity are left out of the product
+            identity = krMatrixKernel.identity_mask(offset_array, IDENTITY_TOLERANCE)
+            new_array = np.where(identity[:, None, None], local_array, np.matmul(local_array, offset_array))
+
+            new_offsets = [om.MMatrix(matrix.ravel().tolist()) for matrix in new_array]
+        else:
+            new_offsets = [local * offset for local, offset in zip(local_matrices, offset_matrices)]
+
+        # reset all of the transform attributes (and the joint orient of joints) - cancelling out the offset parent matrix
+        return new_offsets, [CLEARED_VALUES] * len(new_offsets)
+
+    def fm_offset(self):
+        # returns the new offset parent matrices and channel values of the batch
+        # decompose the whole batch in one call if the kernel (and numpy) is available
+        if krMatrixKernel is not None:
+            new_values = self.fm_offset_values()
+        else:
+            new_values = self.fm_offset_values_api()
+
+        # reset the offsetParentMatrix, and set the transform attributes
+        identity = om.MMatrix(IDENTITY_MATRIX)
+        return [identity] * len(new_values), new_values
+
+    def fm_offset_values(self):
+        local_array, offset_array = self.batch.matrix_arrays()
+
+        # the world matrix is local * offset * parent, so the local matrix once the offset is cleared
+        # (world * parent inverse) is local * offset - there is no need to reparent to read the world matrix
+        trn, rot, scl, shr = krMatrixKernel.decompose_matrices(np.matmul(local_array, offset_array), self.batch.rotate_orders)
+
+        # the rotate plugs are set in radians.  The whole rotation is set on the rotate, so the joint orient is cleared
+        joint_orient = np.zeros((len(trn), 3))
+        new_values = np.concatenate((trn, np.radians(rot), scl, shr, joint_orient), axis=1)
+
+        return new_values.tolist()
+
+    def fm_offset_values_api(self):
+        local_matrices = self.batch.local_matrices
+        offset_matrices = self.batch.offset_matrices
+        # the rotate order enum matches the MEulerRotation order values
+        rotate_orders = self.batch.rotate_orders
+
+        new_values = []
+
+        for local, offset, rotate_order in zip(local_matrices, offset_matrices, rotate_orders):
+            # the world matrix is local * offset * parent, so the local matrix once the offset is cleared
+            # (world * parent inverse) is local * offset - there is no need to reparent to read the world matrix
+            obj_transform_matrix = om.MTransformationMatrix(local * offset)
+
+            # get the rotation in the rotate order of the node, then the translation, scale and shear values
+            rot = obj_transform_matrix.rotation().reorder(rotate_order)
+            trn = obj_transform_matrix.translation(om.MSpace.kTransform)
+            scl = obj_transform_matrix.scale(om.MSpace.kTransform)
+            shr = obj_transform_matrix.shear(om.MSpace.kTransform)
+
+            # the whole rotation is set on the rotate, so the joint orient is cleared
+            new_values.append((trn.x, trn.y, trn.z,
+                               rot.x, rot.y, rot.z,
+                               scl[0], scl[1], scl[2],
+                               shr[0], shr[1], shr[2],
+                               0.0, 0.0, 0.0))
+
+        return new_values
 
     @classmethod
     def creator(cls):
@@ -1001,6 +4194,11 @@ class TransferToOffset(om.MPxCommand):
         # add the flag
         syntax.addFlag(TransferToOffset.REVERSE_FLAG[0], TransferToOffset.REVERSE_FLAG[1])
         syntax.addFlag(TransferToOffset.VERSION_FLAG[0], TransferToOffset.VERSION_FLAG[1])
+        syntax.addFlag(TransferToOffset.HIERARCHY_FLAG[0], TransferToOffset.HIERARCHY_FLAG[1])
+        syntax.addFlag(TransferToOffset.DRY_RUN_FLAG[0], TransferToOffset.DRY_RUN_FLAG[1])
+
+        # query mode is a dry run
+        syntax.enableQuery(True)
         
         return syntax
 
@@ -1029,6 +4227,24 @@ def initializePlugin(plugin):
     except:
         om.MGlobal.displayError("Failed to register draw override: {0}".format(HelpTextDrawOverride.NAME))
         
+    # krLabel node
+    try:
+        plugin_fn.registerNode(LabelNode.TYPE_NAME,
+                               LabelNode.TYPE_ID,
+                               LabelNode.creator,
+                               LabelNode.initialize,
+                               om.MPxNode.kLocatorNode,
+                               LabelNode.DRAW_CLASSIFICATION)
+    except:
+        om.MGlobal.displayError("Failed to register node: {0}".format(LabelNode.TYPE_NAME))
+        
+    try:
+        omr.MDrawRegistry.registerDrawOverrideCreator(LabelNode.DRAW_CLASSIFICATION, 
+                                                      LabelNode.DRAW_REGISTRANT_ID,
+                                                      LabelDrawOverride.creator)
+    except:
+        om.MGlobal.displayError("Failed to register draw override: {0}".format(LabelDrawOverride.NAME))
+        
     # krCondition node
     try:
         plugin_fn.registerNode(AttrCheckNode.TYPE_NAME, 
@@ -1041,6 +4257,39 @@ def initializePlugin(plugin):
     except:
         om.MGlobal.displayError('Failed to register node:  {0}'.format(AttrCheckNode.TYPE_NAME))
     
+    # krConditionArray node
+    try:
+        plugin_fn.registerNode(AttrCheckArrayNode.TYPE_NAME, 
+                               AttrCheckArrayNode.TYPE_ID,
+                               AttrCheckArrayNode.creator, 
+                               AttrCheckArrayNode.initialize, 
+                               om.MPxNode.kDependNode
+                               )
+    except:
+        om.MGlobal.displayError('Failed to register node:  {0}'.format(AttrCheckArrayNode.TYPE_NAME))
+    
+    # krConditionChain node
+    try:
+        plugin_fn.registerNode(AttrCheckChainNode.TYPE_NAME, 
+                               AttrCheckChainNode.TYPE_ID,
+                               AttrCheckChainNode.creator, 
+                               AttrCheckChainNode.initialize, 
+                               om.MPxNode.kDependNode
+                               )
+    except:
+        om.MGlobal.displayError('Failed to register node:  {0}'.format(AttrCheckChainNode.TYPE_NAME))
+    
+    # krExpression node
+    try:
+        plugin_fn.registerNode(ExpressionNode.TYPE_NAME, 
+                               ExpressionNode.TYPE_ID,
+                               ExpressionNode.creator, 
+                               ExpressionNode.initialize, 
+                               om.MPxNode.kDependNode
+                               )
+    except:
+        om.MGlobal.displayError('Failed to register node:  {0}'.format(ExpressionNode.TYPE_NAME))
+    
     # krMultiEqualCondition node
     try:
         plugin_fn.registerNode(ConvertInputNode.TYPE_NAME, 
@@ -1051,22 +4300,53 @@ def initializePlugin(plugin):
                                )
     except:
         om.MGlobal.displayError('Failed to register node:  {0}'.format(ConvertInputNode.TYPE_NAME))
+    
+    # krConditionFused node
+    try:
+        plugin_fn.registerNode(FusedConditionNode.TYPE_NAME, 
+                               FusedConditionNode.TYPE_ID,
+                               FusedConditionNode.creator, 
+                               FusedConditionNode.initialize, 
+                               om.MPxNode.kDependNode
+                               )
+    except:
+        om.MGlobal.displayError('Failed to register node:  {0}'.format(FusedConditionNode.TYPE_NAME))
 
     # krSelect command
     try:
-        plugin_fn.registerContextCommand(SelectObjectContextCmd.COMMAND_NAME, SelectObjectContextCmd.creator)
+        plugin_fn.registerContextCommand(SelectObjectContextCmd.COMMAND_NAME, SelectObjectContextCmd.creator,
+                                         TagObjectsToolCmd.COMMAND_NAME, TagObjectsToolCmd.creator, TagObjectsToolCmd.create_syntax)
     except:
         om.MGlobal.displayError('Failed to register context command: {0}'. format(SelectObjectContextCmd.COMMAND_NAME))
     
+    # krTagged command, and the tag index it uses
+    try:
+        plugin_fn.registerCommand(TaggedQuery.COMMAND_NAME, TaggedQuery.creator, TaggedQuery.create_syntax)
+        TAG_INDEX.install()
+    except:
+        om.MGlobal.displayError("Failed to register command: {0}".format(TaggedQuery.COMMAND_NAME))
+    
     # krTxToOffset command
     try:
         plugin_fn.registerCommand(TransferToOffset.COMMAND_NAME, TransferToOffset.creator, TransferToOffset.create_syntax)
     except:
         om.MGlobal.displayError("Failed to register command: {0}".format(TransferToOffset.COMMAND_NAME))
+    
+    # krConditionNetwork command
+    try:
+        plugin_fn.registerCommand(ConditionNetwork.COMMAND_NAME, ConditionNetwork.creator, ConditionNetwork.create_syntax)
+    except:
+        om.MGlobal.displayError("Failed to register command: {0}".format(ConditionNetwork.COMMAND_NAME))
         
 def uninitializePlugin(plugin):
     plugin_fn = om.MFnPlugin(plugin)
     
+    # krConditionNetwork command
+    try:
+        plugin_fn.deregisterCommand(ConditionNetwork.COMMAND_NAME)
+    except:
+        om.MGlobal.displayError("Failed to deregister command: {0}".format(ConditionNetwork.COMMAND_NAME))
+    
     # krTxToOffset command
     try:
         plugin_fn.deregisterCommand(TransferToOffset.COMMAND_NAME)
@@ -1074,24 +4354,66 @@ def uninitializePlugin(plugin):
         om.MGlobal.displayError("Failed to deregister command: {0}".format(TransferToOffset.COMMAND_NAME))
     
     
+    # krTagged command, and the tag index it uses
+    try:
+        TAG_INDEX.uninstall()
+        plugin_fn.deregisterCommand(TaggedQuery.COMMAND_NAME)
+    except:
+        om.MGlobal.displayError("Failed to deregister command: {0}".format(TaggedQuery.COMMAND_NAME))
+    
     # krSelect command
     try:
-        plugin_fn.deregisterContextCommand(SelectObjectContextCmd.COMMAND_NAME)
+        plugin_fn.deregisterContextCommand(SelectObjectContextCmd.COMMAND_NAME, TagObjectsToolCmd.COMMAND_NAME)
     except:
         om.MGlobal.displayError('Failed to deregister context command: {0}'. format(SelectObjectContextCmd.COMMAND_NAME))
 
+    # krConditionFused node
+    try:
+        plugin_fn.deregisterNode(FusedConditionNode.TYPE_ID)
+    except:
+        om.MGlobal.displayError('Failed to deregister node:  {0}'.format(FusedConditionNode.TYPE_NAME))
+        
     # krMultiEqualCondition node
     try:
         plugin_fn.deregisterNode(ConvertInputNode.TYPE_ID)
     except:
         om.MGlobal.displayError('Failed to deregister node:  {0}'.format(ConvertInputNode.TYPE_NAME))
         
+    # krExpression node
+    try:
+        plugin_fn.deregisterNode(ExpressionNode.TYPE_ID)
+    except:
+        om.MGlobal.displayError('Failed to deregister node:  {0}'.format(ExpressionNode.TYPE_NAME))
+        
+    # krConditionChain node
+    try:
+        plugin_fn.deregisterNode(AttrCheckChainNode.TYPE_ID)
+    except:
+        om.MGlobal.displayError('Failed to deregister node:  {0}'.format(AttrCheckChainNode.TYPE_NAME))
+        
+    # krConditionArray node
+    try:
+        plugin_fn.deregisterNode(AttrCheckArrayNode.TYPE_ID)
+    except:
+        om.MGlobal.displayError('Failed to deregister node:  {0}'.format(AttrCheckArrayNode.TYPE_NAME))
+        
     # krCondition node
     try:
         plugin_fn.deregisterNode(AttrCheckNode.TYPE_ID)
     except:
         om.MGlobal.displayError('Failed to deregister node:  {0}'.format(AttrCheckNode.TYPE_NAME))
     
+    # krLabel node
+    try:
+        omr.MDrawRegistry.deregisterDrawOverrideCreator(LabelNode.DRAW_CLASSIFICATION, LabelNode.DRAW_REGISTRANT_ID)
+    except:
+        om.MGlobal.displayError("Failed to deregister draw override: {0}".format(LabelDrawOverride.NAME))
+    
+    try:
+        plugin_fn.deregisterNode(LabelNode.TYPE_ID)
+    except:
+        om.MGlobal.displayError("Failed to deregister node: {0}".format(LabelNode.TYPE_NAME))
+    
     # krHelpText node
     try:
         omr.MDrawRegistry.deregisterDrawOverrideCreator(HelpTextNode.DRAW_CLASSIFICATION, HelpTextNode.DRAW_REGISTRANT_ID)
@@ -0,0 +1,88 @@
+import numpy as np
+
+from krMatrixKernel import ROTATE_ORDER_AXES, identity_mask, decompose_matrices
+
+
+def axis_rotation(axis, angle):
+    # a row vector rotation about one axis, the way an MMatrix is laid out
+    cos, sin = np.cos(angle), np.sin(angle)
+    j, k = (axis + 1) % 3, (axis + 2) % 3
+
+    matrix = np.identity(3)
+    matrix[j, j] = cos
+    matrix[j, k] = sin
+    matrix[k, j] = -sin
+    matrix[k, k] = cos
+    return matrix
+
+
+def compose(translate, rotate, scale, shear, rotate_order):
+    # scale * shear * rotation * translation, the same as a transform node
+    rotation = np.identity(3)
+    for axis in ROTATE_ORDER_AXES[rotate_order]:
+        rotation = rotation.dot(axis_rotation(axis, np.radians(rotate[axis])))
+
+    shear_matrix = np.identity(3)
+    shear_matrix[1, 0], shear_matrix[2, 0], shear_matrix[2, 1] = shear
+
+    matrix = np.identity(4)
+    matrix[:3, :3] = np.diag(scale).dot(shear_matrix).dot(rotation)
+    matrix[3, :3] = translate
+    return matrix
+
+
+def test_round_trip_every_rotate_order():
+    random = np.random.RandomState(7)
+    count = 50
+
+    for rotate_order in range(len(ROTATE_ORDER_AXES)):
+        translate = random.uniform(-10.0, 10.0, (count, 3))
+        # the middle rotation is kept away from gimbal lock, so the angles come back as they went in
+        rotate = random.uniform(-170.0, 170.0, (count, 3))
+        rotate[:, ROTATE_ORDER_AXES[rotate_order][1]] = random.uniform(-80.0, 80.0, count)
+        scale = random.uniform(0.1, 5.0, (count, 3))
+        shear = random.uniform(-1.0, 1.0, (count, 3))
+
+        matrices = np.array([compose(*values, rotate_order=rotate_order) for values in zip(translate, rotate, scale, shear)])
+        trn, rot, scl, shr = decompose_matrices(matrices, [rotate_order] * count)
+
+        np.testing.assert_allclose(trn, translate, atol=1.0e-9)
+        np.testing.assert_allclose(rot, rotate, atol=1.0e-7)
+        np.testing.assert_allclose(scl, scale, atol=1.0e-9)
+        np.testing.assert_allclose(shr, shear, atol=1.0e-9)
+
+
+def test_mixed_rotate_orders_in_one_batch():
+    rotate_orders = list(range(len(ROTATE_ORDER_AXES)))
+    matrices = np.array([compose((1.0, 2.0, 3.0), (30.0, -45.0, 60.0), (1.0, 2.0, 3.0), (0.0, 0.0, 0.0), order) for order in rotate_orders])
+
+    trn, rot, scl, shr = decompose_matrices(matrices, rotate_orders)
+
+    np.testing.assert_allclose(rot, [(30.0, -45.0, 60.0)] * len(rotate_orders), atol=1.0e-7)
+
+
+def test_negative_scale_recomposes():
+    matrix = compose((0.0, 0.0, 0.0), (10.0, 20.0, 30.0), (2.0, 3.0, -4.0), (0.0, 0.0, 0.0), 0)
+
+    trn, rot, scl, shr = decompose_matrices(matrix)
+
+    np.testing.assert_allclose(compose(trn[0], rot[0], scl[0], shr[0], 0), matrix, atol=1.0e-9)
+
+
+def test_gimbal_lock_recomposes():
+    for rotate_order, (i, j, k) in enumerate(ROTATE_ORDER_AXES):
+        rotate = [25.0, 25.0, 25.0]
+        rotate[j] = 90.0
+        matrix = compose((0.0, 0.0, 0.0), rotate, (1.0, 1.0, 1.0), (0.0, 0.0, 0.0), rotate_order)
+
+        trn, rot, scl, shr = decompose_matrices(matrix, [rotate_order])
+
+        np.testing.assert_allclose(compose(trn[0], rot[0], scl[0], shr[0], rotate_order), matrix, atol=1.0e-6)
+
+
+def test_identity_mask():
+    matrices = np.array([np.identity(4), np.identity(4), np.identity(4)])
+    matrices[1, 3, 0] = 1.0e-12
+    matrices[2, 3, 0] = 1.0e-3
+
+    assert identity_mask(matrices).tolist() == [True, True, False]